@@ -2,51 +2,45 @@
 # !pip install -q nltk
 
 import nltk
-nltk.download('punkt')
 from gliner import GLiNER
 import torch
 import gc
 import os
 from tqdm.auto import tqdm
 
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-
-model = GLiNER.from_pretrained("E3-JSI/gliner-multi-pii-domains-v1").to(device)
+MODEL_NAME = "E3-JSI/gliner-multi-pii-domains-v1"
 labels = ["name", "organizations", "phone number", "email", "email address"]
+SPLIT_PUNCTUATION = {'.', ',', ';', '!', '?'}
 
-def split_long_sentence(text, max_len=384, model=None):
+def split_long_sentence(text, tokens_with_offsets, max_len=384):
     """
-    Recursively split a sentence into chunks with <= max_len tokens.
-    Returns a list of (chunk_text, start_offset, end_offset) tuples.
+    Split a sentence into chunks with <= max_len tokens in a single pass over its
+    (token, start, end) list. Each chunk is cut just after the last punctuation token
+    in the second half of its window when there is one, otherwise at max_len tokens.
+    Returns a list of (chunk_text, start_offset, end_offset) tuples, offsets relative to text.
     """
-    # tokenize to check length
-    token_generator = model.data_processor.words_splitter(text)
-    tokens_with_offsets = [(token, start, end) for token, start, end in token_generator]
-    token_count = len(tokens_with_offsets)
-    
-    if token_count <= max_len:
-        return [(text, tokens_with_offsets[0][1], tokens_with_offsets[-1][2])]
-
-    # ff too long, split into roughly equal parts
-    mid = len(text) // 2
-    # a reasonable split point (e.g., nearest space or punctuation)
-    while mid > 0 and text[mid] not in [' ', '.', ',', ';', '!', '?']:
-        mid -= 1
-    if mid == 0:  # no good split point found, force split
-        mid = len(text) // 2
-
-    left_text = text[:mid].strip()
-    right_text = text[mid:].strip()
-    
-    # recursively split both parts
     chunks = []
-    if left_text:
-        chunks.extend(split_long_sentence(left_text, max_len, model))
-    if right_text:
-        chunks.extend(split_long_sentence(right_text, max_len, model))
-    
+    chunk_start = 0
+    n_tokens = len(tokens_with_offsets)
+
+    while chunk_start < n_tokens:
+        chunk_end = min(chunk_start + max_len, n_tokens)
+
+        # prefer a punctuation boundary, unless this is the final chunk
+        if chunk_end < n_tokens:
+            for i in range(chunk_end, chunk_start + max_len // 2, -1):
+                if tokens_with_offsets[i - 1][0] in SPLIT_PUNCTUATION:
+                    chunk_end = i
+                    break
+
+        start = tokens_with_offsets[chunk_start][1]
+        end = tokens_with_offsets[chunk_end - 1][2]
+        chunks.append((text[start:end], start, end))
+        chunk_start = chunk_end
+
     return chunks
 
+@torch.inference_mode()
 def get_entities_from_long_text(model, text, labels, max_len=384, batch_size=4):
     sentences = nltk.sent_tokenize(text)
     print(f"Number of sentences: {len(sentences)}")
@@ -58,15 +52,15 @@ def get_entities_from_long_text(model, text, labels, max_len=384, batch_size=4):
         start = text.find(sentence, current_pos)
         end = start + len(sentence)
         
+        # Tokenize once; the splitter reuses these offsets
         token_generator = model.data_processor.words_splitter(sentence)
-        tokens = [t for t in token_generator]
-        token_count = len(tokens)
+        tokens_with_offsets = [(token, t_start, t_end) for token, t_start, t_end in token_generator]
         
-        if token_count <= max_len:
+        if len(tokens_with_offsets) <= max_len:
             sentence_spans.append((sentence, start, end))
         else:
-            # Recursively split long sentence
-            chunks = split_long_sentence(sentence, max_len, model)
+            # Split long sentence into max_len token chunks
+            chunks = split_long_sentence(sentence, tokens_with_offsets, max_len)
             for chunk_text, chunk_start, chunk_end in chunks:
                 chunk_start += start
                 chunk_end += start
@@ -106,21 +100,54 @@ def replace_entities_with_labels(text, entities):
     
     return text
 
-input_dir = '/content/gdrive/MyDrive/pii_extraction_sample/original'
-output_dir = '/content/gdrive/MyDrive/pii_extraction_sample/annotated_gliner_splitter_v2'
+def main():
+    nltk.download('punkt')
 
-os.makedirs(output_dir, exist_ok=True)
+    # Chunks are capped at max_len tokens, so batch shapes are nearly uniform: let cuDNN
+    # autotune its kernels and allow TF32 matmuls on Ampere+ GPUs
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
 
-for _f in tqdm(os.listdir(input_dir)):
-    input_path = os.path.join(input_dir, _f)
-    output_path = os.path.join(output_dir, f"{_f}")
+    if torch.cuda.is_available():
+        # Select the device before anything is allocated, so that empty_cache()
+        # in the batching loop never initializes a context on another GPU
+        torch.cuda.set_device(0)
+        device = 'cuda'
+    else:
+        device = 'cpu'
 
-    with open(input_path, 'r') as f:
-        text = f.read()
+    model = GLiNER.from_pretrained(MODEL_NAME).to(device)
+    model.eval()
+
+    input_dir = '/content/gdrive/MyDrive/pii_extraction_sample/original'
+    output_dir = '/content/gdrive/MyDrive/pii_extraction_sample/annotated_gliner_splitter_v2'
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # scandir returns the entry type with the listing, avoiding a stat per file on Drive/FUSE mounts
+    with os.scandir(input_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
+
+    for entry in tqdm(entries):
+        input_path = entry.path
+        output_path = os.path.join(output_dir, entry.name)
+
+        # Skip files already written by a previous (interrupted) run
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            continue
+
+        with open(input_path, 'r') as f:
+            text = f.read()
 
         ents = get_entities_from_long_text(model, text, labels)
 
         modified_text = replace_entities_with_labels(text, ents)
 
-        with open(output_path, 'w') as f:  
-            f.write(modified_text)
\ No newline at end of file
+        # Write to a temporary file first so a partial output never looks complete
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(modified_text)
+        os.replace(tmp_path, output_path)
+
+if __name__ == '__main__':
+    main()
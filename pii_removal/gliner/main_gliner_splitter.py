@@ -6,11 +6,10 @@ import gc
 import os
 from tqdm.auto import tqdm
 
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-
-model = GLiNER.from_pretrained("E3-JSI/gliner-multi-pii-domains-v1").to(device)
+MODEL_NAME = "E3-JSI/gliner-multi-pii-domains-v1"
 labels = ["name", "organizations", "phone number", "email", "email address"]
 
+@torch.inference_mode()
 def get_entities_from_long_text(model, text, labels, max_len=384, batch_size=4):
     # Use words_splitter for tokenization
     token_generator = model.data_processor.words_splitter(text)
@@ -76,17 +75,42 @@ def replace_entities_with_labels(text, entities):
     
     return text
 
-input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
-output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_gliner_splitter'
+def main():
+    # Chunks are capped at max_len tokens, so batch shapes are nearly uniform: let cuDNN
+    # autotune its kernels and allow TF32 matmuls on Ampere+ GPUs
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
+
+    if torch.cuda.is_available():
+        # Select the device before anything is allocated, so that empty_cache()
+        # in the batching loop never initializes a context on another GPU
+        torch.cuda.set_device(0)
+        device = 'cuda'
+    else:
+        device = 'cpu'
+
+    model = GLiNER.from_pretrained(MODEL_NAME).to(device)
+    model.eval()
+
+    input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
+    output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_gliner_splitter'
 
-os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
 
-for _f in tqdm(os.listdir(input_dir)):
-    input_path = os.path.join(input_dir, _f)
-    output_path = os.path.join(output_dir, f"{_f}")
+    # scandir returns the entry type with the listing, avoiding a stat per file on Drive/FUSE mounts
+    with os.scandir(input_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
 
-    with open(input_path, 'r') as f:
-        text = f.read()
+    for entry in tqdm(entries):
+        input_path = entry.path
+        output_path = os.path.join(output_dir, entry.name)
+
+        # Skip files already written by a previous (interrupted) run
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            continue
+
+        with open(input_path, 'r') as f:
+            text = f.read()
 
         # Get entities using the modified function
         ents = get_entities_from_long_text(model, text, labels, max_len=384)
@@ -94,6 +118,11 @@ for _f in tqdm(os.listdir(input_dir)):
         # Replace entities in text
         modified_text = replace_entities_with_labels(text, ents)
 
-        # Write output
-        with open(output_path, 'w') as f:
-            f.write(modified_text)
\ No newline at end of file
+        # Write output to a temporary file first so a partial output never looks complete
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(modified_text)
+        os.replace(tmp_path, output_path)
+
+if __name__ == '__main__':
+    main()
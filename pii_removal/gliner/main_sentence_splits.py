@@ -2,54 +2,80 @@
 
 # !pip install -q gliner
 import os
+import torch
 from tqdm.auto import tqdm
 
 from gliner import GLiNER
-model = GLiNER.from_pretrained("E3-JSI/gliner-multi-pii-domains-v1").to('cuda')
 
+MODEL_NAME = "E3-JSI/gliner-multi-pii-domains-v1"
 labels = ["name", "organizations", "phone number", "email", "email address"]
-input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
-output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_sentence_splits'
 
-os.makedirs(output_dir, exist_ok=True)
+def main():
+    # Let cuDNN autotune its kernels and allow TF32 matmuls on Ampere+ GPUs
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
 
-for _f in tqdm(os.listdir(input_dir)):
-      input_path = os.path.join(input_dir, _f)
-      output_path = os.path.join(output_dir, f"{_f}")
+    # Select the device before anything is allocated on it
+    torch.cuda.set_device(0)
+    model = GLiNER.from_pretrained(MODEL_NAME).to('cuda')
+    model.eval()
 
-      with open(input_path, 'r') as f:
-          text = f.read()
+    input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
+    output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_sentence_splits'
 
-      all_sentences = text.split(".")
+    os.makedirs(output_dir, exist_ok=True)
 
-      redacted_sentences = []
+    # scandir returns the entry type with the listing, avoiding a stat per file on Drive/FUSE mounts
+    with os.scandir(input_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
 
-      for sentence in all_sentences:
-          entities = model.predict_entities(sentence, labels, threshold=0.5)
+    for entry in tqdm(entries):
+        input_path = entry.path
+        output_path = os.path.join(output_dir, entry.name)
 
-          if not entities:
-              redacted_sentences.append(sentence)
-              continue
+        # Skip files already written by a previous (interrupted) run
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            continue
 
-          # sort entities by start index to ensure clean replacements
-          entities = sorted(entities, key=lambda e: e["start"])
+        with open(input_path, 'r') as f:
+            text = f.read()
 
-          redacted = []
-          last_idx = 0
+        all_sentences = text.split(".")
 
-          for entity in entities:
-              start, end = entity['start'], entity['end']
-              original_text = sentence[start:end]
-              label = entity['label'].upper().replace(' ', '_')
-              placeholder = f"[{label}: {original_text}]"
+        redacted_sentences = []
 
-              redacted.append(sentence[last_idx:start])
-              redacted.append(placeholder)
-              last_idx = end
+        with torch.inference_mode():
+            for sentence in all_sentences:
+                entities = model.predict_entities(sentence, labels, threshold=0.5)
 
-          redacted.append(sentence[last_idx:])
-          redacted_sentences.append("".join(redacted))
-      
+                if not entities:
+                    redacted_sentences.append(sentence)
+                    continue
 
-      with open(output_path, 'w') as f:
-        f.write("".join(redacted_sentences))
\ No newline at end of file
+                # sort entities by start index to ensure clean replacements
+                entities = sorted(entities, key=lambda e: e["start"])
+
+                redacted = []
+                last_idx = 0
+
+                for entity in entities:
+                    start, end = entity['start'], entity['end']
+                    original_text = sentence[start:end]
+                    label = entity['label'].upper().replace(' ', '_')
+                    placeholder = f"[{label}: {original_text}]"
+
+                    redacted.append(sentence[last_idx:start])
+                    redacted.append(placeholder)
+                    last_idx = end
+
+                redacted.append(sentence[last_idx:])
+                redacted_sentences.append("".join(redacted))
+
+        # Write to a temporary file first so a partial output never looks complete
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write("".join(redacted_sentences))
+        os.replace(tmp_path, output_path)
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,26 @@
 # !pip install -q gliner
 
 from gliner import GLiNER
+import numpy as np
 import torch
 import gc
+import os
+from tqdm.auto import tqdm
 
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-
-model = GLiNER.from_pretrained("E3-JSI/gliner-multi-pii-domains-v1").to(device)
+MODEL_NAME = "E3-JSI/gliner-multi-pii-domains-v1"
 labels = ["name", "organizations", "phone number", "email", "email address"]
 
-def get_spans_from_mapping(offset_mapping):
-    return [(chunk[1][0], chunk[-2][1]) for chunk in offset_mapping]
+def get_spans_from_mapping(offset_mapping, attention_mask):
+    # offset_mapping is (n_chunks, max_len, 2); skip CLS and the last real token (SEP)
+    lengths = attention_mask.sum(axis=1)
+    starts = offset_mapping[:, 1, 0]
+    ends = offset_mapping[np.arange(len(offset_mapping)), lengths - 2, 1]
+    return list(zip(starts.tolist(), ends.tolist()))
 
 def get_texts_from_spans(text, spans):
     return [text[start:end] for start, end in spans]
 
+@torch.inference_mode()
 def get_entities_from_long_text(model, text, labels, batch_size = 4):
     transformer_tokenizer = model.data_processor.transformer_tokenizer
     max_len = model.config.max_len
@@ -25,17 +31,18 @@ def get_entities_from_long_text(model, text, labels, batch_size = 4):
         return_overflowing_tokens = True,  # ensure to True to return the extra tokens > max len
         max_length = max_len,
         truncation = True,
-        return_offsets_mapping = True  # get the mappings in order to cut the text into chunks afterwards
+        return_offsets_mapping = True,  # get the mappings in order to cut the text into chunks afterwards
+        padding = 'max_length',  # uniform chunk length so the mappings come back as one array
+        return_tensors = 'np'
     )
     mapping = encoded["offset_mapping"]
 
-    spans = get_spans_from_mapping(offset_mapping=mapping)
+    spans = get_spans_from_mapping(offset_mapping=mapping, attention_mask=encoded["attention_mask"])
     texts = get_texts_from_spans(text=text, spans=spans)
 
     # print(len(texts[0]), len(texts[1]))
 
     print(len(texts))
-    entities = model.batch_predict_entities(texts, labels, threshold=0.5) # batch preds, since if we want a fixed batch size.
 
     all_entities = []
     # Manual batching
@@ -71,26 +78,52 @@ def replace_entities_with_labels(text, entities):
 
     return text
 
-import os
-from tqdm.auto import tqdm
+def main():
+    # Chunks are capped at max_len tokens, so batch shapes are nearly uniform: let cuDNN
+    # autotune its kernels and allow TF32 matmuls on Ampere+ GPUs
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
 
-input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
-output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_tokenized'
+    if torch.cuda.is_available():
+        # Select the device before anything is allocated, so that empty_cache()
+        # in the batching loop never initializes a context on another GPU
+        torch.cuda.set_device(0)
+        device = 'cuda'
+    else:
+        device = 'cpu'
 
-labels = ['name', 'organizations', 'phone number', 'email', 'email address']
+    model = GLiNER.from_pretrained(MODEL_NAME).to(device)
+    model.eval()
 
-os.makedirs(output_dir, exist_ok=True)
+    input_dir = '/content/drive/MyDrive/pii_extraction_sample/original'
+    output_dir = '/content/drive/MyDrive/pii_extraction_sample/annotated_tokenized'
 
-for _f in tqdm(os.listdir(input_dir)):
-    input_path = os.path.join(input_dir, _f)
-    output_path = os.path.join(output_dir, f"{_f}")
+    os.makedirs(output_dir, exist_ok=True)
 
-    with open(input_path, 'r') as f:
-        text = f.read()
+    # scandir returns the entry type with the listing, avoiding a stat per file on Drive/FUSE mounts
+    with os.scandir(input_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
+
+    for entry in tqdm(entries):
+        input_path = entry.path
+        output_path = os.path.join(output_dir, entry.name)
+
+        # Skip files already written by a previous (interrupted) run
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            continue
+
+        with open(input_path, 'r') as f:
+            text = f.read()
 
         ents = get_entities_from_long_text(model, text, labels)
 
         modified_text = replace_entities_with_labels(text, ents)
 
-        with open(output_path, 'w') as f:
-            f.write(modified_text)
\ No newline at end of file
+        # Write to a temporary file first so a partial output never looks complete
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(modified_text)
+        os.replace(tmp_path, output_path)
+
+if __name__ == '__main__':
+    main()
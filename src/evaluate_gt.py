@@ -2,14 +2,108 @@
 
 import re
 import os
-import glob
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from Levenshtein import distance, ratio
+from rapidfuzz.distance import Indel
 from typing import List, Dict, Tuple, Optional, Union
 import pandas as pd
 
+# Documents longer than this (in characters) are scored window by window
+LONG_DOCUMENT_THRESHOLD = 100_000
+WINDOW_SIZE = 4096
+# Windows are aligned on short exact substrings (shingles) of the ground truth found in the prediction
+SHINGLE_SIZE = 32
+ANCHOR_ATTEMPTS = 8
+ANCHOR_SEARCH_MARGIN = 4 * WINDOW_SIZE
+
+
+def _find_anchor(gt_text: str, pred_text: str, gt_pos: int, expected: int, lower: int) -> Optional[int]:
+    """
+    Locate the prediction position that corresponds to gt_text[gt_pos].
+    
+    Shingles taken from the ground truth at and after gt_pos are searched in the prediction,
+    first near the expected position and then anywhere after lower, so alignment survives
+    insertions and deletions of any length. The first shingle found fixes the position.
+    
+    Returns:
+        Optional[int]: Position in pred_text, or None when no shingle is found
+    """
+    step = max(1, WINDOW_SIZE // ANCHOR_ATTEMPTS)
+    for shift in range(0, min(WINDOW_SIZE, len(gt_text) - gt_pos - SHINGLE_SIZE + 1), step):
+        shingle = gt_text[gt_pos + shift:gt_pos + shift + SHINGLE_SIZE]
+        near_start = max(lower, expected + shift - ANCHOR_SEARCH_MARGIN)
+        found = pred_text.find(shingle, near_start, expected + shift + SHINGLE_SIZE + ANCHOR_SEARCH_MARGIN)
+        if found == -1:
+            found = pred_text.find(shingle, lower)
+        if found != -1:
+            return max(lower, found - shift)
+    return None
+
+
+def document_similarity(gt_text: str, pred_text: str, score_cutoff: float = 0.0) -> float:
+    """
+    Normalized similarity between two documents, on the same scale as Levenshtein.ratio.
+    
+    Short documents are compared in one go with RapidFuzz's bit-parallel Indel scorer.
+    Long documents are cut into WINDOW_SIZE windows of the ground truth. The prediction is
+    cut at the positions where each window's content is found again (see _find_anchor),
+    keeping the running offset when no anchor is found, so both documents are partitioned
+    into aligned pieces. Each piece pair is scored with Indel and the scores are combined
+    weighted by length, which approximates the whole-document ratio at linear cost.
+    
+    Args:
+        gt_text (str): Ground truth text
+        pred_text (str): Predicted text
+        score_cutoff (float): Scores below this value are reported as 0 (default: 0.0)
+        
+    Returns:
+        float: Similarity in [0, 1]
+    """
+    if max(len(gt_text), len(pred_text)) <= LONG_DOCUMENT_THRESHOLD:
+        return Indel.normalized_similarity(gt_text, pred_text, score_cutoff=score_cutoff)
+    
+    if not gt_text or not pred_text:
+        return 0.0
+    
+    # boundaries[i] is where the prediction piece matching the i-th ground truth window starts
+    boundaries = [0]
+    offset = 0
+    last_anchor = 0
+    unanchored = []
+    for start in range(WINDOW_SIZE, len(gt_text), WINDOW_SIZE):
+        anchor = _find_anchor(gt_text, pred_text, start, start + offset, last_anchor)
+        if anchor is None:
+            # Keep the running offset; the cut is revisited once a later window is anchored
+            unanchored.append(len(boundaries))
+            boundaries.append(min(max(start + offset, boundaries[-1]), len(pred_text)))
+            continue
+        offset = anchor - start
+        last_anchor = anchor
+        # Content deleted from the prediction leaves the windows before this anchor with empty pieces
+        for i in unanchored:
+            boundaries[i] = min(boundaries[i], anchor)
+        unanchored = []
+        boundaries.append(anchor)
+    boundaries.append(len(pred_text))
+    
+    total = 0.0
+    weight = 0
+    for i, start in enumerate(range(0, len(gt_text), WINDOW_SIZE)):
+        gt_window = gt_text[start:start + WINDOW_SIZE]
+        pred_window = pred_text[boundaries[i]:boundaries[i + 1]]
+        window_weight = len(gt_window) + len(pred_window)
+        total += Indel.normalized_similarity(gt_window, pred_window) * window_weight
+        weight += window_weight
+    
+    similarity = total / max(1, weight)
+    return similarity if similarity >= score_cutoff else 0.0
+
 
 class Evaluator:
-    def __init__(self, gt_dir: str, pred_dir: str, file_pattern: str = "*.md"):
+    def __init__(self, gt_dir: str, pred_dir: str, file_pattern: str = "*.md", max_workers: Optional[int] = None,
+                 score_cutoff: float = 0.0):
         """
         Initialize the evaluator with directories containing ground truth and prediction markdown files.
         
@@ -17,10 +111,15 @@ class Evaluator:
             gt_dir (str): Directory containing ground truth markdown files
             pred_dir (str): Directory containing prediction markdown files
             file_pattern (str): File pattern to match (default: "*.md")
+            max_workers (Optional[int]): Number of worker processes (default: os.cpu_count())
+            score_cutoff (float): Overall similarities below this value are reported as 0,
+                letting the scorer exit early (default: 0.0)
         """
         self.gt_dir = gt_dir
         self.pred_dir = pred_dir
         self.file_pattern = file_pattern
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+        self.score_cutoff = score_cutoff
         
         self.gt_files = self._get_files(gt_dir, file_pattern)
         self.pred_files = self._get_files(pred_dir, file_pattern)
@@ -44,10 +143,15 @@ class Evaluator:
             Dict[str, str]: Dictionary mapping filename (without extension) to full path
         """
         files = {}
-        for file_path in glob.glob(os.path.join(directory, pattern)):
-            filename = os.path.basename(file_path)
-            name_without_ext = os.path.splitext(filename)[0]
-            files[name_without_ext] = file_path
+        # scandir hands back the entry type with the listing, so no extra stat per file
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                if not entry.is_file():
+                    continue
+                name_without_ext = os.path.splitext(entry.name)[0]
+                files[name_without_ext] = entry.path
         return files
     
     def _match_files(self) -> List[Tuple[str, str, str]]:
@@ -63,7 +167,8 @@ class Evaluator:
                 matched.append((file_id, self.gt_files[file_id], self.pred_files[file_id]))
         return matched
     
-    def _read_file(self, file_path: str) -> str:
+    @staticmethod
+    def _read_file(file_path: str) -> str:
         """
         Read file content.
         
@@ -76,7 +181,8 @@ class Evaluator:
         with open(file_path, 'r', encoding='utf-8') as f:
             return f.read()
     
-    def _extract_tables(self, text: str) -> List[str]:
+    @staticmethod
+    def _extract_tables(text: str) -> List[str]:
         """
         Extract LaTeX tables from text.
         
@@ -98,7 +204,8 @@ class Evaluator:
         tables = md_tables + latex_tables
         return tables
     
-    def _extract_formulas(self, text: str) -> List[str]:
+    @staticmethod
+    def _extract_formulas(text: str) -> List[str]:
         """
         Extract LaTeX formulas from text.
         
@@ -120,30 +227,32 @@ class Evaluator:
         formulas = md_formulas + latex_formulas
         return formulas
     
-    def evaluate_file(self, file_id: str, gt_path: str, pred_path: str) -> Dict:
+    @staticmethod
+    def evaluate_file(file_id: str, gt_path: str, pred_path: str, score_cutoff: float = 0.0) -> Dict:
         """
-        Evaluate a single file pair.
+        Evaluate a single file pair. Static so it can be shipped to worker processes.
         
         Args:
             file_id (str): File identifier
             gt_path (str): Path to ground truth file
             pred_path (str): Path to prediction file
+            score_cutoff (float): Cutoff passed to document_similarity (default: 0.0)
             
         Returns:
             Dict: Evaluation metrics for the file
         """
-        gt_text = self._read_file(gt_path)
-        pred_text = self._read_file(pred_path)
+        gt_text = Evaluator._read_file(gt_path)
+        pred_text = Evaluator._read_file(pred_path)
         
 
-        gt_tables = self._extract_tables(gt_text)
-        pred_tables = self._extract_tables(pred_text)
+        gt_tables = Evaluator._extract_tables(gt_text)
+        pred_tables = Evaluator._extract_tables(pred_text)
         
-        gt_formulas = self._extract_formulas(gt_text)
-        pred_formulas = self._extract_formulas(pred_text)
+        gt_formulas = Evaluator._extract_formulas(gt_text)
+        pred_formulas = Evaluator._extract_formulas(pred_text)
         
 
-        overall_similarity = ratio(gt_text, pred_text)
+        overall_similarity = document_similarity(gt_text, pred_text, score_cutoff)
         
         # Calculate table metrics
         table_similarities = []
@@ -186,19 +295,28 @@ class Evaluator:
             }
         }
     
-    def evaluate_all(self) -> Dict:
+    def evaluate_all(self, force: bool = False) -> Dict:
         """
         Evaluate all matched file pairs.
         
+        Args:
+            force (bool): Re-evaluate even if results are already available (default: False)
+            
         Returns:
             Dict: Evaluation results for all files
         """
+        if self.results and not force:
+            return self.results
+        
         file_results = []
         
-        for file_id, gt_path, pred_path in self.matched_files:
-            print(f"Evaluating {file_id}...")
-            result = self.evaluate_file(file_id, gt_path, pred_path)
-            file_results.append(result)
+        if self.matched_files:
+            file_ids, gt_paths, pred_paths = zip(*self.matched_files)
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                for result in executor.map(self.evaluate_file, file_ids, gt_paths, pred_paths,
+                                           repeat(self.score_cutoff)):
+                    print(f"Evaluated {result['file_id']}")
+                    file_results.append(result)
         
 
         overall_similarities = [r["overall_similarity"] for r in file_results]
@@ -256,6 +374,7 @@ class Evaluator:
         df.to_csv(output_path, index=False)
         print(f"Results saved to {output_path}")
 
-evaluator = Evaluator("../data/markdown_truths/", "../data/predictions/mistral/", "*.md")
-results = evaluator.evaluate_all()
-evaluator.save_results("evaluation_results_markdown_mistral.csv")
\ No newline at end of file
+if __name__ == '__main__':
+    evaluator = Evaluator("../data/markdown_truths/", "../data/predictions/mistral/", "*.md")
+    results = evaluator.evaluate_all()
+    evaluator.save_results("evaluation_results_markdown_mistral.csv")
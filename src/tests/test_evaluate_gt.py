@@ -0,0 +1,49 @@
+import random
+
+from rapidfuzz.distance import Indel
+
+from src.evaluate_gt import LONG_DOCUMENT_THRESHOLD, document_similarity
+
+
+def _text(rng, size):
+    """Random words joined by spaces, cut to exactly size characters"""
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(2, 9))) for _ in range(2000)]
+    out = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return ' '.join(out)[:size]
+
+
+def test_short_documents_use_the_exact_ratio():
+    rng = random.Random(0)
+    gt = _text(rng, 5000)
+    pred = gt[:2000] + _text(rng, 300) + gt[2000:]
+    assert document_similarity(gt, pred) == Indel.normalized_similarity(gt, pred)
+
+
+def test_long_document_with_prepended_text():
+    rng = random.Random(1)
+    gt = _text(rng, 2 * LONG_DOCUMENT_THRESHOLD)
+    pred = _text(rng, 15_000) + gt
+    # gt is fully contained in pred, so the exact ratio is 2 * len(gt) / (len(gt) + len(pred))
+    expected = 2 * len(gt) / (len(gt) + len(pred))
+    assert abs(document_similarity(gt, pred) - expected) < 0.01
+
+
+def test_long_document_with_inserted_and_deleted_text():
+    rng = random.Random(2)
+    gt = _text(rng, 2 * LONG_DOCUMENT_THRESHOLD)
+    pred = gt[:40_000] + _text(rng, 10_000) + gt[40_000:120_000] + gt[140_000:]
+    expected = Indel.normalized_similarity(gt, pred)
+    assert abs(document_similarity(gt, pred) - expected) < 0.01
+
+
+def test_long_unrelated_documents_score_low():
+    rng = random.Random(3)
+    gt = _text(rng, 2 * LONG_DOCUMENT_THRESHOLD)
+    pred = _text(random.Random(4), 2 * LONG_DOCUMENT_THRESHOLD)
+    assert document_similarity(gt, pred) < 0.5
+    assert document_similarity(gt, pred, score_cutoff=0.9) == 0.0
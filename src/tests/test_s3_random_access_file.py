@@ -0,0 +1,101 @@
+import ctypes
+import io
+
+import pypdfium2 as pdfium
+import pytest
+
+import src.tokenizer_client as tokenizer_client
+from src.tokenizer_client import S3RandomAccessFile
+
+
+class StubS3Client:
+    """Serves head_object and ranged get_object calls from an in-memory object and records the ranges"""
+
+    def __init__(self, data):
+        self.data = data
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.data)}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        self.ranges.append((start, end))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(tokenizer_client, 'S3_BLOCK_SIZE', 16)
+    monkeypatch.setattr(tokenizer_client, 'S3_CACHED_BLOCKS', 4)
+
+
+DATA = bytes(range(256)) * 2
+
+
+def test_read_across_block_boundaries(small_blocks):
+    client = StubS3Client(DATA)
+    with S3RandomAccessFile(client, 'bucket', 'key') as f:
+        f.seek(10)
+        assert f.read(40) == DATA[10:50]
+        assert f.tell() == 50
+        # Blocks 0-3 cover bytes 0-63, each fetched once
+        assert sorted(client.ranges) == [(0, 15), (16, 31), (32, 47), (48, 63)]
+
+        client.ranges.clear()
+        f.seek(20)
+        assert f.read(20) == DATA[20:40]
+        assert client.ranges == []
+
+
+def test_seek_whence_and_end_of_object(small_blocks):
+    client = StubS3Client(DATA)
+    with S3RandomAccessFile(client, 'bucket', 'key') as f:
+        assert f.seek(-5, io.SEEK_END) == len(DATA) - 5
+        assert f.read(100) == DATA[-5:]
+        assert f.read(1) == b''
+        f.seek(8)
+        assert f.seek(4, io.SEEK_CUR) == 12
+        assert f.read(8) == DATA[12:20]
+        with pytest.raises(ValueError):
+            f.seek(0, 3)
+        # The last block is short, so its range ends at the last byte of the object
+        assert (496, 511) in client.ranges
+
+
+def test_readinto_ctypes_buffer(small_blocks):
+    with S3RandomAccessFile(StubS3Client(DATA), 'bucket', 'key') as f:
+        f.seek(30)
+        buffer = (ctypes.c_ubyte * 20)()
+        assert f.readinto(buffer) == 20
+        assert bytes(buffer) == DATA[30:50]
+
+
+def test_least_recently_used_blocks_are_evicted(small_blocks):
+    client = StubS3Client(DATA)
+    with S3RandomAccessFile(client, 'bucket', 'key') as f:
+        for index in range(5):
+            f.seek(index * 16)
+            f.read(1)
+        # Only S3_CACHED_BLOCKS blocks are kept; block 0 was used least recently
+        assert list(f._blocks) == [1, 2, 3, 4]
+
+        client.ranges.clear()
+        f.seek(0)
+        assert f.read(1) == DATA[:1]
+        assert client.ranges == [(0, 15)]
+        assert list(f._blocks) == [2, 3, 4, 0]
+
+
+def test_count_pages_of_s3_pdf(monkeypatch, small_blocks):
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(3):
+        pdf.new_page(200, 200)
+    data = io.BytesIO()
+    pdf.save(data)
+    pdf.close()
+
+    client = StubS3Client(data.getvalue())
+    monkeypatch.setattr(tokenizer_client, '_get_s3_client', lambda: client)
+    assert tokenizer_client._count_pages("s3://bucket/docs/file.pdf") == 3
+    assert client.ranges
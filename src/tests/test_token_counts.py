@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.tokenizer_client import LocalStorageS3Upload
+from src.tokenizer_client_parallel import LocalStorageS3Upload as ParallelLocalStorageS3Upload
+
+TEXTS = [
+    "",
+    "   ",
+    "Hello world",
+    "  leading and trailing  ",
+    "tabs\tand\nnew\r\nlines\x0bvertical\x0cfeed",
+    "Hello\xa0world",
+    "em space, thin space and ideographic　space",
+    "next\x85line, line separator, paragraph separator, narrow nbsp, math space, ogham mark",
+    "file\x1cgroup\x1drecord\x1eunit\x1fseparators",
+    "control\x00chars\x01do\x07not\x1bsplit",
+    "Ünïcödé wörds, 中文字符 and emoji 🚀🚀 mixed\xa0in",
+    "combining é and zero​width space",
+]
+
+
+@pytest.fixture
+def client():
+    # The counters do not use any instance state, so no S3 or directory setup is needed
+    return LocalStorageS3Upload.__new__(LocalStorageS3Upload)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_count_words_matches_str_split(client, text):
+    words, count = client.count_words(text)
+    assert words.to_pylist() == text.split()
+    assert count == len(text.split())
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_count_characters_excludes_only_spaces(client, text):
+    chars, count = client.count_characters(text)
+    # Compared as code points: NumPy shows a NUL character in a '<U1' array as an empty string
+    assert chars.view(np.uint32).tolist() == [ord(c) for c in text.replace(' ', '')]
+    assert count == len(text.replace(' ', ''))
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_count_words_and_chars_matches_str_split(text):
+    words, word_count, chars, char_count = ParallelLocalStorageS3Upload.count_words_and_chars(text)
+    assert words.to_pylist() == text.split()
+    assert word_count == len(text.split())
+    assert ''.join(chars.to_pylist()) == text.replace(' ', '')
+    assert char_count == len(text.replace(' ', ''))
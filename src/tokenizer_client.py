@@ -1,26 +1,241 @@
 import os
 import io
+import re
 import boto3
+from boto3.s3.transfer import TransferConfig
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from typing import Final
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import logging
+import logging.handlers
+import queue
+import atexit
 from pathlib import Path
 
 from tqdm.auto import tqdm
 import datetime
 import json
+import threading
+import multiprocessing
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+# Buffered tokens are written out once they reach this size
+FLUSH_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+# Objects above 8 MB are uploaded as multipart, with up to 10 parts in flight
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=10)
+
+# Parquet compression for every object written; zstd is about twice as compact as snappy on token text
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_COMPRESSION_LEVEL = 3
+
+# Schema of the per-file summary rows, built once instead of inferred on every write
+SUMMARY_SCHEMA = pa.schema([
+    ('filename', pa.string()),
+    ('file_type', pa.string()),
+    ('word_token_count', pa.int64()),
+    ('char_token_count', pa.int64()),
+    ('process_timestamp', pa.string())
+])
+
+# Smallest page range handed to a PDF extraction worker
+MIN_PAGES_PER_TASK = 16
+
+# PDFs on S3 are read in blocks of this size, up to S3_READ_CONCURRENCY range requests at a time
+S3_BLOCK_SIZE = 256 * 1024
+S3_READ_CONCURRENCY = 16
+S3_CACHED_BLOCKS = 64
+
+# Whitespace as str.split() sees it. The ASCII separators are matched byte by byte in the UTF-8
+# encoding; the non-ASCII ones are first mapped to a space, since they span several bytes
+_WHITESPACE_BYTES = np.zeros(256, dtype=bool)
+_WHITESPACE_BYTES[[0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x1C, 0x1D, 0x1E, 0x1F, 0x20]] = True
+_UNICODE_WHITESPACE_RE = re.compile('[\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]')
+
+class S3RandomAccessFile(io.RawIOBase):
+    """
+    Seekable, read-only file over an S3 object that fetches only the byte ranges being read.
+    PDFium only needs the xref table and the objects it references, so most of a large PDF
+    is never downloaded. Reads are aligned to S3_BLOCK_SIZE blocks; the blocks missing for a
+    read are fetched concurrently and the most recently used ones are kept.
+    """
+
+    def __init__(self, client, bucket, key):
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._size = client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self._pos = 0
+        self._blocks = OrderedDict()
+        self._fetch_pool = ThreadPoolExecutor(max_workers=S3_READ_CONCURRENCY)
+
+    def _fetch_block(self, index):
+        start = index * S3_BLOCK_SIZE
+        end = min(start + S3_BLOCK_SIZE, self._size) - 1
+        response = self._client.get_object(Bucket=self._bucket, Key=self._key, Range=f"bytes={start}-{end}")
+        return response['Body'].read()
+
+    def _read_blocks(self, first, last):
+        """Return the bytes of blocks [first, last], fetching the missing ones in parallel"""
+        indices = range(first, last + 1)
+        missing = [index for index in indices if index not in self._blocks]
+        for index, block in zip(missing, self._fetch_pool.map(self._fetch_block, missing)):
+            self._blocks[index] = block
+        data = b"".join(self._blocks[index] for index in indices)
+
+        for index in indices:
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > S3_CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return data
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._pos)
+        if size <= 0:
+            return 0
+        first = self._pos // S3_BLOCK_SIZE
+        last = (self._pos + size - 1) // S3_BLOCK_SIZE
+        offset = self._pos - first * S3_BLOCK_SIZE
+        # Callers may pass ctypes arrays (format '<B'), which only accept writes through a byte view
+        memoryview(buffer).cast('B')[:size] = self._read_blocks(first, last)[offset:offset + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._fetch_pool.shutdown()
+        self._blocks.clear()
+        super().close()
+
+def _setup_logging(log_file):
+    """
+    Log to log_file through a queue: the processing and upload threads only enqueue records,
+    and a single listener thread writes them, so no thread waits on the file handler's lock.
+    Like logging.basicConfig, does nothing if the root logger is already configured.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # Drain the queue before the interpreter exits
+    atexit.register(listener.stop)
+
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+@lru_cache(maxsize=None)
+def _get_s3_client():
+    """S3 client for reading PDFs, created once per process"""
+    return boto3.client(
+        "s3",
+        region_name=os.getenv("AWS_REGION"),
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_KEY")
+    )
+
+def _open_pdf(source):
+    """Open a PDF from a local path or an s3://bucket/key URI"""
+    if source.startswith("s3://"):
+        bucket, key = source[len("s3://"):].split("/", 1)
+        # autoclose closes the stream, and with it the fetch pool, together with the document
+        return pdfium.PdfDocument(S3RandomAccessFile(_get_s3_client(), bucket, key), autoclose=True)
+    return pdfium.PdfDocument(source)
+
+def _filename_column(key, n):
+    """The file's key for n token rows, stored once as a dictionary value rather than once per row"""
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int32)), pa.array([key]))
+
+def _count_pages(source):
+    """Return the number of pages of a PDF. Runs in a worker process, so the parent never calls PDFium."""
+    pdf = _open_pdf(source)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def _extract_pages(source, start, end):
+    """Extract the text of pages [start, end) of a PDF. Runs in a worker process."""
+    pdf = _open_pdf(source)
+    try:
+        parts = []
+        for index in range(start, end):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            page_text = textpage.get_text_range()
+            # Release page handles right away instead of waiting for the document
+            textpage.close()
+            page.close()
+            if page_text:
+                parts.append(page_text)
+        # Pages do not end with a newline; without one, words at page boundaries would merge
+        return "".join(page_text + "\n" for page_text in parts)
+    finally:
+        pdf.close()
 
 class LocalStorageS3Upload:
-    def __init__(self, base_dir='', sub_folder='', save_to_local=False):
-        """Initialize LocalStorage with a base directory for reading files and for writing results"""
+    def __init__(self, base_dir='', sub_folder='', save_to_local=False, max_workers=16, pdf_workers=None,
+                 load_summary=True):
+        """
+        Initialize LocalStorage with a base directory for reading files and for writing results.
+        With load_summary=False the counters start at 0 instead of at the global summary's totals.
+        """
 
         self.base_dir = Path(base_dir)
         self.raw_data_dir = self.base_dir
         self.save_to_local = save_to_local
         self.destination_bucket = "raw_data_estimation"
         self.sub_folder = sub_folder
+        self.max_workers = max_workers
+        self.pdf_workers = pdf_workers or os.cpu_count()
+
+        # The upload and PDF pools are created on first use (see _pool and _pdf_pool), so a client
+        # that hands its subdirectories to worker processes does not start pools it never uses
+        self._upload_pool = None
+        self._pdf_worker_pool = None
+        self._pools_lock = threading.Lock()
+        self._pending = []
+        # Files are processed concurrently, so the cumulative counters and buffers need a lock
+        self._lock = threading.Lock()
+
+        # Per-file summaries and tokens are buffered and written in batches by _flush
+        self._summary_rows = []
+        self._word_token_tables = []
+        self._char_token_tables = []
+        self._buffered_bytes = 0
+        self._flush_count = 0
+        self._set_key_prefixes(self.sub_folder)
         
         if not self.save_to_local:
             self.client: boto3.session.Session.client = boto3.client(
@@ -43,16 +258,26 @@ class LocalStorageS3Upload:
 
         self.cumulative_token_count_words = 0
         self.cumulative_token_count_chars = 0
-        self.global_summary_path = f"{self.destination_bucket}/global_summary.parquet"
+        # Each run writes its own run_<timestamp>.parquet here; the latest one holds the current totals
+        self.global_summary_dir = f"{self.destination_bucket}/global_summary"
+        # Single-file summary written before the per-run layout; read only while no run file exists
+        self.legacy_global_summary_path = f"{self.destination_bucket}/global_summary.parquet"
 
         self.log_file = "token_count.log"
-        logging.basicConfig(filename=self.log_file, level=logging.INFO,
-                            format='%(asctime)s - %(message)s')
+        _setup_logging(self.log_file)
         
         self.count = 0
+        # Directory -> files under it, so each tree is walked only once
+        self._file_cache = {}
 
         # Load cumulative counts from existing global summary if available
-        self.load_global_summary()
+        if load_summary:
+            self.load_global_summary()
+
+    def _set_key_prefixes(self, sub_folder):
+        """Build the summary and token key prefixes once per subfolder"""
+        self._summary_prefix = f"{self.destination_bucket}/{sub_folder}/summaries/"
+        self._tokens_prefix = f"{self.destination_bucket}/{sub_folder}/tokens/"
 
     def _setup_directories(self, sub_folder):
         """Setup necessary directories for a given subfolder"""
@@ -66,45 +291,101 @@ class LocalStorageS3Upload:
     def __repr__(self):
         return self.__str__()
 
+    @property
+    def _pool(self):
+        """Thread pool for S3 uploads, which are awaited before the global summary is written"""
+        with self._pools_lock:
+            if self._upload_pool is None:
+                self._upload_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._upload_pool
+
+    @property
+    def _pdf_pool(self):
+        """
+        Process pool for PDF text extraction, which is CPU-bound and not thread-safe in PDFium;
+        spawn avoids forking while the processing threads hold locks
+        """
+        with self._pools_lock:
+            if self._pdf_worker_pool is None:
+                self._pdf_worker_pool = ProcessPoolExecutor(max_workers=self.pdf_workers,
+                                                            mp_context=multiprocessing.get_context("spawn"))
+            return self._pdf_worker_pool
+
+    def close(self):
+        """Shut down the upload and PDF extraction pools that were started"""
+        for pool in (self._upload_pool, self._pdf_worker_pool):
+            if pool is not None:
+                pool.shutdown()
+
+    def _walk(self, root):
+        """Yield the paths of all files below root; DirEntry caches the file type, so no stat per entry"""
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_file():
+                    yield entry.path
+                elif entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path)
+
+    def _list_files(self, directory):
+        """Return the files below directory, walking it on first use only"""
+        directory = Path(directory)
+        if directory not in self._file_cache:
+            self._file_cache[directory] = [Path(path) for path in self._walk(directory)]
+        return self._file_cache[directory]
+
     @property
     def total_files(self):
         """Count total number of files in raw_data directory"""
         self.count = 0
         try:
-            for file in self.raw_data_dir.glob('**/*'):
-                if file.is_file():
-                    self.count += 1
+            self.count = len(self._list_files(self.raw_data_dir))
         except Exception as e:
-            logging.error(f"Error counting files: {str(e)}")
+            logging.error("Error counting files: %s", e)
         
         return self.count
 
     def load_global_summary(self):
-        """Load existing global summary if available"""
+        """Load existing global summary if available, falling back to the legacy single-file summary"""
         try:
-            if self.save_to_local and Path(self.global_summary_path).exists():
-                df = pd.read_parquet(self.global_summary_path)
+            if self.save_to_local:
+                # Run files are named by timestamp, so the last one in sort order is the latest
+                run_files = sorted(Path(self.global_summary_dir).glob('run_*.parquet'))
+                if run_files:
+                    source = run_files[-1]
+                elif Path(self.legacy_global_summary_path).exists():
+                    source = self.legacy_global_summary_path
+                else:
+                    return
+                df = pd.read_parquet(source)
                 if not df.empty:
                     last_row = df.iloc[-1]
                     self.cumulative_token_count_words = last_row.get('word_token_count', 0)
                     self.cumulative_token_count_chars = last_row.get('char_token_count', 0)
-                    logging.info(f"Loaded existing global summary: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
-            elif not self.save_to_local:
+                    logging.info("Loaded existing global summary from %s: %s words, %s chars", source, self.cumulative_token_count_words, self.cumulative_token_count_chars)
+            else:
+                paginator = self.client.get_paginator('list_objects_v2')
+                run_keys = [
+                    obj['Key']
+                    for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.global_summary_dir}/run_")
+                    for obj in page.get('Contents', [])
+                ]
+                key = max(run_keys) if run_keys else self.legacy_global_summary_path
                 try:
                     response = self.client.get_object(
                         Bucket=self.bucket_name,
-                        Key=self.global_summary_path
+                        Key=key
                     )
-                    df = pd.read_parquet(io.BytesIO(response['Body'].read()))
-                    if not df.empty:
-                        last_row = df.iloc[-1]
-                        self.cumulative_token_count_words = last_row.get('word_token_count', 0)
-                        self.cumulative_token_count_chars = last_row.get('char_token_count', 0)
-                        logging.info(f"Loaded existing global summary from S3: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
                 except self.client.exceptions.NoSuchKey:
                     logging.info("No existing global summary found in S3")
+                    return
+                df = pd.read_parquet(io.BytesIO(response['Body'].read()))
+                if not df.empty:
+                    last_row = df.iloc[-1]
+                    self.cumulative_token_count_words = last_row.get('word_token_count', 0)
+                    self.cumulative_token_count_chars = last_row.get('char_token_count', 0)
+                    logging.info("Loaded existing global summary from S3 %s: %s words, %s chars", key, self.cumulative_token_count_words, self.cumulative_token_count_chars)
         except Exception as e:
-            logging.error(f"Error loading global summary: {str(e)}")
+            logging.error("Error loading global summary: %s", e)
             print(f"Error loading global summary: {str(e)}")
 
     def list_objects(self):
@@ -113,15 +394,29 @@ class LocalStorageS3Upload:
             # If no subfolder specified, discover and process all subdirectories
             if not self.sub_folder:
                 subdirs = self._discover_subdirectories()
-                for subdir in subdirs:
-                    print(f"Processing subdirectory: {subdir}")
-                    logging.info(f"Processing subdirectory: {subdir}")
-                    
-                    if self.save_to_local:
-                        self._setup_directories(subdir)
+                
+                # Subdirectories are independent, so each one is processed in its own process;
+                # the cores are shared between them for PDF extraction
+                n_workers = max(1, min(os.cpu_count(), len(subdirs)))
+                pdf_workers = max(1, os.cpu_count() // n_workers)
+                with ProcessPoolExecutor(max_workers=n_workers,
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    futures = {}
+                    for subdir in subdirs:
+                        print(f"Processing subdirectory: {subdir}")
+                        logging.info("Processing subdirectory: %s", subdir)
+                        futures[subdir] = executor.submit(_process_subdirectory, str(self.base_dir), subdir,
+                                                          self.save_to_local, self.max_workers, pdf_workers)
                     
-                    subdir_path = self.base_dir / subdir
-                    self._process_directory(subdir_path, subdir)
+                    # Each worker counts its own subdirectory; add them to the totals loaded at startup
+                    for subdir, future in futures.items():
+                        try:
+                            word_token_count, char_token_count = future.result()
+                            self.cumulative_token_count_words += word_token_count
+                            self.cumulative_token_count_chars += char_token_count
+                        except Exception as e:
+                            print(f"Error processing subdirectory {subdir}: {str(e)}")
+                            logging.error("Error processing subdirectory %s: %s", subdir, e)
             else:
                 # Process the specified directory
                 self._process_directory(self.raw_data_dir, self.sub_folder)
@@ -131,7 +426,7 @@ class LocalStorageS3Upload:
             
         except Exception as e:
             print(f"Error listing objects: {str(e)}")
-            logging.error(f"Error listing objects: {str(e)}")
+            logging.error("Error listing objects: %s", e)
 
     def _discover_subdirectories(self):
         """Discover all subdirectories in the base directory"""
@@ -145,9 +440,9 @@ class LocalStorageS3Upload:
                 # If no subdirectories found, use base directory name
                 subdirs = [self.base_dir.name]
                 
-            logging.info(f"Discovered subdirectories: {', '.join(subdirs)}")
+            logging.info("Discovered subdirectories: %s", ', '.join(subdirs))
         except Exception as e:
-            logging.error(f"Error discovering subdirectories: {str(e)}")
+            logging.error("Error discovering subdirectories: %s", e)
             print(f"Error discovering subdirectories: {str(e)}")
         
         return subdirs
@@ -155,24 +450,27 @@ class LocalStorageS3Upload:
     def _process_directory(self, directory_path, subdir_name):
         """Process all files in a specific directory"""
         try:
-            # Save the current subfolder for this processing run
-            self.current_sub_folder = subdir_name
+            self._set_key_prefixes(subdir_name)
             
-            file_list = list(directory_path.glob('**/*'))
-            files = [f for f in file_list if f.is_file()]
+            files = self._list_files(directory_path)
             
-            for file_path in tqdm(files, desc=f"Processing files in {subdir_name}"):
-                rel_path = file_path.relative_to(self.base_dir)
-                logging.info(f"Found raw data object: {rel_path}")
-                self.process_object(file_path)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(tqdm(executor.map(self.process_object, files), total=len(files),
+                          desc=f"Processing files in {subdir_name}"))
+            
+            # Write out whatever is still buffered for this subfolder
+            self._flush()
             
         except Exception as e:
             print(f"Error processing directory {directory_path}: {str(e)}")
-            logging.error(f"Error processing directory {directory_path}: {str(e)}")
+            logging.error("Error processing directory %s: %s", directory_path, e)
 
     def process_object(self, file_path):
         """Process a single file, extract tokens and save immediately"""
         try:
+            rel_path = file_path.relative_to(self.base_dir)
+            logging.info("Found raw data object: %s", rel_path)
+
             file_extension = file_path.suffix.lower().lstrip('.')
             
             if file_extension == "pdf":
@@ -180,23 +478,31 @@ class LocalStorageS3Upload:
             elif file_extension == "html":
                 self.process_html(file_path)
             else:
-                logging.info(f"Unsupported file type: {file_extension}")
+                logging.info("Unsupported file type: %s", file_extension)
                 
         except Exception as e:
             print(f"Error processing object {file_path}: {str(e)}")
-            logging.error(f"Error processing object {file_path}: {str(e)}")
+            logging.error("Error processing object %s: %s", file_path, e)
 
-    def process_pdf(self, file_path):
+    def process_pdf(self, file_path, key=None):
         try:
-            key = str(file_path.relative_to(self.base_dir))
-            
-            with open(file_path, 'rb') as file:
-                reader = PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text
+            source = str(file_path)
+            if key is None:
+                key = str(file_path.relative_to(self.base_dir))
+            # One timestamp per file, shared by everything recorded for it
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            
+            # Opening the document (and, for S3, fetching its xref) happens in a PDF worker,
+            # so the processing threads never wait on one another here
+            n_pages = self._pdf_pool.submit(_count_pages, source).result()
+            
+            # Split the pages into contiguous ranges, one task per PDF worker, and join them in page order
+            pages_per_task = max(MIN_PAGES_PER_TASK, -(-n_pages // self.pdf_workers))
+            futures = [
+                self._pdf_pool.submit(_extract_pages, source, start, min(start + pages_per_task, n_pages))
+                for start in range(0, n_pages, pages_per_task)
+            ]
+            text = "".join(future.result() for future in futures)
             
             # Get tokenized words
             words, word_token_count = self.count_words(text)
@@ -204,37 +510,59 @@ class LocalStorageS3Upload:
             # Get tokenized characters
             chars, char_token_count = self.count_characters(text)
 
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
+            logging.info("%s : Word Tokens = %s, Character Tokens = %s", key, word_token_count, char_token_count)
 
             print(f"PDF Name: {key}")
             print(f"Word Tokens: {word_token_count}")
             print(f"Character Tokens: {char_token_count}")
             
-            self.cumulative_token_count_words += word_token_count
-            self.cumulative_token_count_chars += char_token_count
+            with self._lock:
+                self.cumulative_token_count_words += word_token_count
+                self.cumulative_token_count_chars += char_token_count
 
             # Save file summary
-            self.save_file_summary(key, 'pdf', word_token_count, char_token_count)
+            self.save_file_summary(key, 'pdf', word_token_count, char_token_count, ts)
             
             # Save tokens for this file
             self.save_file_tokens(key, words, chars)
 
-            logging.info(f"Cumulative word token count: {self.cumulative_token_count_words}")
-            logging.info(f"Cumulative character token count: {self.cumulative_token_count_chars}")
+            logging.info("Cumulative word token count: %s", self.cumulative_token_count_words)
+            logging.info("Cumulative character token count: %s", self.cumulative_token_count_chars)
 
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
-            logging.error(f"Error processing PDF: {str(e)}")
+            logging.error("Error processing PDF: %s", e)
+
+    def process_s3_pdf(self, bucket, object_key):
+        """Process a PDF stored on S3, downloading only the byte ranges PDFium reads"""
+        self.process_pdf(f"s3://{bucket}/{object_key}", key=object_key)
 
     def process_html(self, file_path):
         try:
             key = str(file_path.relative_to(self.base_dir))
+            # One timestamp per file, shared by everything recorded for it
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             
             with open(file_path, 'r', encoding='utf-8') as file:
-                soup = BeautifulSoup(file, 'html.parser')
+                html = file.read()
+            
+            try:
+                tree = LexborHTMLParser(html)
+                # Scripts and styles are not document text
+                for node in tree.css('script, style'):
+                    node.decompose()
+                # Text nodes are joined without a separator, as get_text() did, so inline markup
+                # such as H<sub>2</sub>O does not split words
+                text = tree.root.text(separator='')
+            except Exception as e:
+                logging.warning("selectolax could not parse %s, falling back to BeautifulSoup: %s", key, e)
+                soup = BeautifulSoup(html, 'lxml')
+                for tag in soup(['script', 'style']):
+                    tag.decompose()
                 text = soup.get_text()
-                text = text.strip()
-                text = os.linesep.join([s for s in text.splitlines() if s.strip()])
+            
+            text = text.strip()
+            text = os.linesep.join([s for s in text.splitlines() if s.strip()])
             
             # Get tokenized words
             words, word_token_count = self.count_words(text)
@@ -242,196 +570,233 @@ class LocalStorageS3Upload:
             # Get tokenized characters
             chars, char_token_count = self.count_characters(text)
 
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
+            logging.info("%s : Word Tokens = %s, Character Tokens = %s", key, word_token_count, char_token_count)
 
             print(f"HTML Name: {key}")
             print(f"Word Tokens: {word_token_count}")
             print(f"Character Tokens: {char_token_count}")
 
-            self.cumulative_token_count_words += word_token_count
-            self.cumulative_token_count_chars += char_token_count
+            with self._lock:
+                self.cumulative_token_count_words += word_token_count
+                self.cumulative_token_count_chars += char_token_count
 
             # Save file summary
-            self.save_file_summary(key, 'html', word_token_count, char_token_count)
+            self.save_file_summary(key, 'html', word_token_count, char_token_count, ts)
             
             # Save tokens for this file
             self.save_file_tokens(key, words, chars)
 
-            logging.info(f"Cumulative word token count: {self.cumulative_token_count_words}")
-            logging.info(f"Cumulative character token count: {self.cumulative_token_count_chars}")
+            logging.info("Cumulative word token count: %s", self.cumulative_token_count_words)
+            logging.info("Cumulative character token count: %s", self.cumulative_token_count_chars)
 
         except Exception as e:
             print(f"Error processing HTML: {str(e)}")
-            logging.error(f"Error processing HTML: {str(e)}")
+            logging.error("Error processing HTML: %s", e)
 
-    def save_file_summary(self, key, file_type, word_token_count, char_token_count):
-        """Save summary information for a single file to S3"""
+    def save_file_summary(self, key, file_type, word_token_count, char_token_count, ts=None):
+        """Buffer summary information for a single file, written out by _flush"""
         try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Extract safe filename
-            base_filename = self.get_safe_filename(key)
-            
-            # Create DataFrame for file summary
-            file_summary_df = pd.DataFrame([{
-                'filename': key,
-                'file_type': file_type,
-                'word_token_count': word_token_count,
-                'char_token_count': char_token_count,
-                'process_timestamp': timestamp
-            }])
-            
-            # Use the current subfolder being processed
-            current_subfolder = getattr(self, 'current_sub_folder', self.sub_folder)
-            
-            # Upload file summary
-            file_summary_buffer = io.BytesIO()
-            file_summary_df.to_parquet(file_summary_buffer)
-            file_summary_buffer.seek(0)
-            
-            file_summary_key = f"{self.destination_bucket}/{current_subfolder}/summaries/{base_filename}_{timestamp}.parquet"
-
-            if self.save_to_local:
-                file_summary_df.to_parquet(f'{file_summary_key}')
-            
-            else:
-                self.client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=file_summary_key,
-                    Body=file_summary_buffer.getvalue()
-                )
+            timestamp = ts or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             
-            logging.info(f"Uploaded file summary to {file_summary_key}")
+            with self._lock:
+                self._summary_rows.append({
+                    'filename': key,
+                    'file_type': file_type,
+                    'word_token_count': word_token_count,
+                    'char_token_count': char_token_count,
+                    'process_timestamp': timestamp
+                })
             
         except Exception as e:
-            logging.error(f"Error saving file summary for {key}: {str(e)}")
+            logging.error("Error saving file summary for %s: %s", key, e)
             print(f"Error saving file summary for {key}: {str(e)}")
     
     def save_file_tokens(self, key, words, chars):
-        """Save tokens for a single file to S3"""
+        """Buffer tokens for a single file, written out by _flush once the buffer is full"""
         try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Extract safe filename
-            base_filename = self.get_safe_filename(key)
-            
-            # Use the current subfolder being processed
-            current_subfolder = getattr(self, 'current_sub_folder', self.sub_folder)
+            # Tokens keep their order within a file, so no explicit index column is stored
+            # The filename column is dictionary-encoded, so the buffer size tracks the tokens themselves
+            word_tokens_table = pa.table({
+                'filename': _filename_column(key, len(words)),
+                'token': pa.array(words, type=pa.string())
+            })
+            char_tokens_table = pa.table({
+                'filename': _filename_column(key, len(chars)),
+                'token': pa.array(chars, type=pa.string())
+            })
+            
+            with self._lock:
+                if words:
+                    self._word_token_tables.append(word_tokens_table)
+                self._char_token_tables.append(char_tokens_table)
+                self._buffered_bytes += word_tokens_table.nbytes + char_tokens_table.nbytes
+            
+            self._flush_if_full()
             
-            # Save word tokens
-            word_tokens_list = [{'index': idx, 'token': token} for idx, token in enumerate(words)]
-            if word_tokens_list:
-                word_tokens_df = pd.DataFrame(word_tokens_list)
-                
-                word_tokens_buffer = io.BytesIO()
-                word_tokens_df.to_parquet(word_tokens_buffer)
-                word_tokens_buffer.seek(0)
+        except Exception as e:
+            logging.error("Error saving tokens for %s: %s", key, e)
+            print(f"Error saving tokens for {key}: {str(e)}")
+    
+    def _flush_if_full(self):
+        """Flush the buffered summaries and tokens once they exceed FLUSH_THRESHOLD_BYTES"""
+        if self._buffered_bytes >= FLUSH_THRESHOLD_BYTES:
+            self._flush()
+    
+    def _flush(self):
+        """Write buffered summaries and tokens as one parquet object per category"""
+        with self._lock:
+            summary_rows, self._summary_rows = self._summary_rows, []
+            word_token_tables, self._word_token_tables = self._word_token_tables, []
+            char_token_tables, self._char_token_tables = self._char_token_tables, []
+            self._buffered_bytes = 0
+            self._flush_count += 1
+            batch_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{self._flush_count:05d}"
+        
+        try:
+            if summary_rows:
+                # Written with pyarrow directly; a pandas DataFrame would only add a conversion step
+                file_summary_table = pa.Table.from_pylist(summary_rows, schema=SUMMARY_SCHEMA)
+                file_summary_key = self._summary_prefix + "summaries_" + batch_id + ".parquet"
                 
-                word_tokens_key = f"{self.destination_bucket}/{current_subfolder}/tokens/{base_filename}_words_{timestamp}.parquet"
-
                 if self.save_to_local:
-                    word_tokens_df.to_parquet(f'{word_tokens_key}')
-                
+                    pq.write_table(file_summary_table, file_summary_key, compression=PARQUET_COMPRESSION, compression_level=PARQUET_COMPRESSION_LEVEL)
                 else:
-                    self.client.put_object(
-                        Bucket=self.bucket_name,
-                        Key=word_tokens_key,
-                        Body=word_tokens_buffer.getvalue()
-                    )
-                logging.info(f"Uploaded word tokens for {base_filename}")
-            
-            char_tokens_list = [{'index': idx, 'token': token} for idx, token in enumerate(chars)]
-            char_tokens_df = pd.DataFrame(char_tokens_list)
+                    file_summary_buffer = pa.BufferOutputStream()
+                    pq.write_table(file_summary_table, file_summary_buffer, compression=PARQUET_COMPRESSION, compression_level=PARQUET_COMPRESSION_LEVEL)
+                    self._upload(file_summary_key, pa.BufferReader(file_summary_buffer.getvalue()))
+                logging.info("Uploaded %s file summaries to %s", len(summary_rows), file_summary_key)
             
-            char_tokens_buffer = io.BytesIO()
-            char_tokens_df.to_parquet(char_tokens_buffer)
-            char_tokens_buffer.seek(0)
+            if word_token_tables:
+                word_tokens_key = self._tokens_prefix + "words_" + batch_id + ".parquet"
+                self._write_tables(word_tokens_key, word_token_tables)
+                logging.info("Uploaded word tokens for %s files to %s", len(word_token_tables), word_tokens_key)
             
-            char_tokens_key = f"{self.destination_bucket}/{current_subfolder}/tokens/{base_filename}_chars_{timestamp}.parquet"
-
-            if self.save_to_local:
-                char_tokens_df.to_parquet(f'{char_tokens_key}')
-            
-            else:
-                self.client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=char_tokens_key,
-                    Body=char_tokens_buffer.getvalue()
-                )
-            logging.info(f"Uploaded char tokens for {base_filename}")
+            if char_token_tables:
+                char_tokens_key = self._tokens_prefix + "chars_" + batch_id + ".parquet"
+                self._write_tables(char_tokens_key, char_token_tables)
+                logging.info("Uploaded char tokens for %s files to %s", len(char_token_tables), char_tokens_key)
             
         except Exception as e:
-            logging.error(f"Error saving tokens for {key}: {str(e)}")
-            print(f"Error saving tokens for {key}: {str(e)}")
+            logging.error("Error flushing batch %s: %s", batch_id, e)
+            print(f"Error flushing batch {batch_id}: {str(e)}")
     
+    def _write_tables(self, key, tables):
+        """Write tables into a single parquet object, one row group per table (i.e. per file)"""
+        sink = key if self.save_to_local else pa.BufferOutputStream()
+        # Token text follows a Zipfian vocabulary, so dictionary encoding shrinks it well before compression
+        with pq.ParquetWriter(
+            sink,
+            tables[0].schema,
+            compression=PARQUET_COMPRESSION,
+            compression_level=PARQUET_COMPRESSION_LEVEL,
+            use_dictionary=True,
+            data_page_size=1 << 20,
+            # Without the Arrow schema, readers see filename as a plain string column, as before
+            store_schema=False
+        ) as writer:
+            for table in tables:
+                writer.write_table(table)
+        
+        if not self.save_to_local:
+            # Read the written buffer in place instead of copying it into a bytes object
+            self._upload(key, pa.BufferReader(sink.getvalue()))
+    
+    def _upload(self, key, fileobj):
+        """Queue an S3 upload of a file-like object on the upload thread pool"""
+        self._pending.append(
+            self._pool.submit(self.client.upload_fileobj, fileobj, self.bucket_name, key, Config=TRANSFER_CONFIG)
+        )
+
+    def _wait_for_uploads(self):
+        """Block until all queued S3 uploads have finished, logging any failures"""
+        pending, self._pending = self._pending, []
+        done, _ = wait(pending)
+        for future in done:
+            if future.exception() is not None:
+                logging.error("Error uploading to S3: %s", future.exception())
+                print(f"Error uploading to S3: {str(future.exception())}")
+
     def update_global_summary(self):
         """Update the global summary file with current counts"""
         try:
+            self._flush()
+            self._wait_for_uploads()
+
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             
             # Create new summary record
             new_summary = {
-                'word_token_count': self.cumulative_token_count_words,
-                'char_token_count': self.cumulative_token_count_chars,
+                'word_token_count': int(self.cumulative_token_count_words),
+                'char_token_count': int(self.cumulative_token_count_chars),
                 'process_timestamp': timestamp
             }
             
-            # Read existing summary if it exists, or create new one
-            if self.save_to_local and Path(self.global_summary_path).exists():
-                try:
-                    existing_df = pd.read_parquet(self.global_summary_path)
-                    # Append new summary
-                    updated_df = pd.concat([existing_df, pd.DataFrame([new_summary])], ignore_index=True)
-                except:
-                    # If corrupted or can't read, create new
-                    updated_df = pd.DataFrame([new_summary])
-            else:
-                updated_df = pd.DataFrame([new_summary])
-                
+            # Write this run's record as its own file instead of rewriting the whole history
+            summary_table = pa.Table.from_pylist([new_summary])
+            global_summary_key = f"{self.global_summary_dir}/run_{timestamp}.parquet"
+            
             if self.save_to_local:
-                # Save updated summary locally
-                updated_df.to_parquet(self.global_summary_path)
+                os.makedirs(self.global_summary_dir, exist_ok=True)
+                pq.write_table(summary_table, global_summary_key, compression=PARQUET_COMPRESSION, compression_level=PARQUET_COMPRESSION_LEVEL)
             else:
-                # Save to S3
-                summary_buffer = io.BytesIO()
-                updated_df.to_parquet(summary_buffer)
-                summary_buffer.seek(0)
+                summary_buffer = pa.BufferOutputStream()
+                pq.write_table(summary_table, summary_buffer, compression=PARQUET_COMPRESSION, compression_level=PARQUET_COMPRESSION_LEVEL)
                 
-                self.client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=self.global_summary_path,
-                    Body=summary_buffer.getvalue()
+                self.client.upload_fileobj(
+                    pa.BufferReader(summary_buffer.getvalue()),
+                    self.bucket_name,
+                    global_summary_key,
+                    Config=TRANSFER_CONFIG
                 )
             
             print(f"Successfully updated global summary data: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
-            logging.info(f"Successfully updated global summary data: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
+            logging.info("Successfully updated global summary data: %s words, %s chars", self.cumulative_token_count_words, self.cumulative_token_count_chars)
             
         except Exception as e:
-            logging.error(f"Error updating global summary: {str(e)}")
+            logging.error("Error updating global summary: %s", e)
             print(f"Error updating global summary: {str(e)}")
     
-    def get_safe_filename(self, key):
-        """Extract a safe filename from the key"""
-        # Remove path and extension
-        base_name = os.path.basename(key)
-        base_name = os.path.splitext(base_name)[0]
-        
-        # Replace any non-alphanumeric characters with underscores
-        import re
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', base_name)
-        
-        return safe_name
-    
     def count_words(self, text: str):
-        """ Counts tokens by splitting text by space and returns the token count """
-        tokens = text.split()  # Split text by spaces
-        return tokens, len(tokens)
+        """ Counts tokens by splitting text by whitespace and returns them as an Arrow string array with the count """
+        # Tokens are runs of UTF-8 bytes that are not whitespace. Their start/end offsets are found with
+        # vectorized comparisons, and the Arrow array is built from the token bytes and offsets directly,
+        # so no Python string is created per token
+        if not text.isascii():
+            text = _UNICODE_WHITESPACE_RE.sub(' ', text)
+        buf = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        is_token = ~_WHITESPACE_BYTES[buf]
+        edges = np.diff(is_token.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+
+        offsets = np.zeros(starts.size + 1, dtype=np.int32)
+        np.cumsum(ends - starts, out=offsets[1:])
+        tokens = pa.StringArray.from_buffers(starts.size, pa.py_buffer(offsets), pa.py_buffer(buf[is_token]))
+        return tokens, starts.size
 
     def count_characters(self, text: str):
-        """ Counts characters in the text excluding spaces and returns the count """
-        text_without_spaces = text.replace(" ", "")  # Remove spaces
-        return list(text_without_spaces), len(text_without_spaces)
+        """ Counts characters in the text excluding spaces and returns them as a NumPy array with the count """
+        # UTF-32 has one fixed-width code unit per character, so the filtering is a vectorized
+        # comparison and no Python object is created per character
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        chars = codes[codes != 0x20].view('<U1')
+        return chars, chars.size
+
+def _process_subdirectory(base_dir, subdir, save_to_local, max_workers, pdf_workers):
+    """Process one subdirectory in a worker process and return its (word, character) token counts"""
+    # Count this subdirectory only: the parent has loaded the totals of earlier runs and adds these to them
+    client = LocalStorageS3Upload(base_dir=base_dir, sub_folder=subdir, save_to_local=save_to_local,
+                                  max_workers=max_workers, pdf_workers=pdf_workers, load_summary=False)
+    try:
+        client._process_directory(client.base_dir / subdir, subdir)
+        client._wait_for_uploads()
+        return client.cumulative_token_count_words, client.cumulative_token_count_chars
+    finally:
+        client.close()
 
 if __name__ == '__main__':
     client = LocalStorageS3Upload(base_dir='../raw-text-tokenization/data', sub_folder = 'imperative_space', save_to_local = False)
-    client.list_objects()
\ No newline at end of file
+    try:
+        client.list_objects()
+    finally:
+        client.close()
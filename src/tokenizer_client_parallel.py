@@ -1,17 +1,170 @@
 import os
 import io
+import re
+import mmap
 import boto3
+import numpy as np
+from boto3.s3.transfer import TransferConfig
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from typing import Final
-from PyPDF2 import PdfReader
-from bs4 import BeautifulSoup
+import pypdfium2 as pdfium
+from selectolax.lexbor import LexborHTMLParser
 import logging
 from pathlib import Path
 from tqdm.auto import tqdm
 import datetime
-import json
-from multiprocessing import Pool, Manager
-from functools import partial
+import time
+import orjson
+from itertools import chain
+from multiprocessing import Pool, util
+
+# Per-file status lines are printed by the workers only when VERBOSE is set; otherwise workers would
+# contend for stdout on every file, and the progress bar already shows how far processing is
+VERBOSE = bool(os.getenv("VERBOSE"))
+
+# Production runs can set LOG_LEVEL=WARNING so the per-file INFO records are not written to the log file
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# PDFs at least this large are dispatched first, one per task
+LARGE_PDF_BYTES = 10 * 1024 * 1024
+
+# Parquet write options: fast zstd, and no column statistics, which are mostly footer on small objects.
+# The Arrow schema is not stored, so the dictionary-encoded filename column reads back as a plain string
+PARQUET_OPTIONS = {'compression': 'zstd', 'compression_level': 1, 'write_statistics': False, 'store_schema': False}
+
+# Schemas of the batched parquet objects, built once instead of inferred on every write
+SUMMARY_SCHEMA = pa.schema([
+    ('filename', pa.string()),
+    ('file_type', pa.string()),
+    ('word_token_count', pa.int64()),
+    ('char_token_count', pa.int64()),
+    ('process_timestamp', pa.string())
+])
+# Same columns as tokenizer_client's token objects; rows keep the token order within each file,
+# so no index column is stored
+TOKEN_SCHEMA = pa.schema([
+    ('filename', pa.dictionary(pa.int32(), pa.string())),
+    ('token', pa.string())
+])
+
+# Workers are replaced after this many tasks, bounding the memory each one accumulates; a retiring
+# worker exits normally, so its finalizer still writes out its last batch
+MAX_TASKS_PER_CHILD = 200
+
+# A worker writes out its buffered rows once this many token rows have accumulated
+BATCH_FLUSH_ROWS = 1_000_000
+
+# Objects above 8 MB are uploaded as multipart, with up to 8 parts in flight
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=8)
+
+# Per-worker sink and S3 client, created by the pool initializer
+_SINK = None
+_S3 = None
+
+# Whitespace as str.split() sees it. The ASCII separators are matched byte by byte in the UTF-8
+# encoding; the non-ASCII ones are first mapped to a space, since they span several bytes
+_WHITESPACE_BYTES = np.zeros(256, dtype=bool)
+_WHITESPACE_BYTES[[0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x1C, 0x1D, 0x1E, 0x1F, 0x20]] = True
+_UNICODE_WHITESPACE_RE = re.compile('[\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]')
+
+# Second of the last formatted summary timestamp, and its formatted value
+_LAST_SEC = None
+_LAST_TS = None
+
+def _filename_column(key, n):
+    """The file's key for n token rows, stored once as a dictionary value rather than once per row"""
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int32)), pa.array([key]))
+
+def _timestamp():
+    """Format the current time, reusing the previous result while the second has not changed"""
+    global _LAST_SEC, _LAST_TS
+    now_sec = int(time.time())
+    if now_sec != _LAST_SEC:
+        _LAST_TS = time.strftime("%Y%m%d_%H%M%S", time.localtime(now_sec))
+        _LAST_SEC = now_sec
+    return _LAST_TS
+
+class _BatchSink:
+    """Buffers summary and token rows in a worker and writes one parquet object per category and batch"""
+
+    def __init__(self, subdir_name, save_to_local, bucket_name, destination_bucket):
+        self.subdir_name = subdir_name
+        self.save_to_local = save_to_local
+        self.bucket_name = bucket_name
+        self.destination_bucket = destination_bucket
+        self.summary_rows = []
+        self.word_tables = []
+        self.char_tables = []
+        self.token_rows = 0
+        self.flush_count = 0
+
+    def add(self, summary_row=None, word_table=None, char_table=None):
+        if summary_row is not None:
+            self.summary_rows.append(summary_row)
+        for tables, table in ((self.word_tables, word_table), (self.char_tables, char_table)):
+            if table is not None and table.num_rows:
+                tables.append(table)
+                self.token_rows += table.num_rows
+        if self.token_rows >= BATCH_FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows, one parquet object per category"""
+        self.flush_count += 1
+        # The pid keeps the objects of concurrent workers apart
+        batch_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{self.flush_count:05d}"
+        prefix = f"{self.destination_bucket}/{self.subdir_name}"
+        
+        batches = []
+        if self.summary_rows:
+            batches.append((f"{prefix}/summaries/summaries_{batch_id}.parquet", SUMMARY_SCHEMA,
+                            lambda: [pa.RecordBatch.from_pylist(self.summary_rows, schema=SUMMARY_SCHEMA)]))
+        if self.word_tables:
+            batches.append((f"{prefix}/tokens/words_{batch_id}.parquet", TOKEN_SCHEMA, lambda: self.word_tables))
+        if self.char_tables:
+            batches.append((f"{prefix}/tokens/chars_{batch_id}.parquet", TOKEN_SCHEMA, lambda: self.char_tables))
+        
+        for key, schema, build_parts in batches:
+            try:
+                # Stream the parts (one per file for tokens) into a single writer; no pandas, no concatenated copy
+                parts = build_parts()
+                sink = key if self.save_to_local else pa.BufferOutputStream()
+                with pq.ParquetWriter(sink, schema, **PARQUET_OPTIONS) as writer:
+                    for part in parts:
+                        writer.write(part)
+                if not self.save_to_local:
+                    _S3.upload_fileobj(pa.BufferReader(sink.getvalue()), self.bucket_name, key, Config=TRANSFER_CONFIG)
+                logging.info("Uploaded %d rows to %s", sum(part.num_rows for part in parts), key)
+            except Exception as e:
+                logging.error("Error writing batch %s: %s", key, e)
+                print(f"Error writing batch {key}: {str(e)}")
+        
+        self.summary_rows = []
+        self.word_tables = []
+        self.char_tables = []
+        self.token_rows = 0
+
+def _init_s3(region, access_key, secret_key):
+    """Create the S3 client of this worker; one client keeps its connection pool alive across uploads"""
+    global _S3
+    _S3 = boto3.client(
+        "s3",
+        region_name=region,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key
+    )
+
+def _init_worker(subdir_name, save_to_local, bucket_name, destination_bucket, s3_credentials):
+    """Pool initializer: create this worker's sink and S3 client, and flush the sink when the worker exits"""
+    global _SINK
+    _SINK = _BatchSink(subdir_name, save_to_local, bucket_name, destination_bucket)
+    if not save_to_local:
+        _init_s3(*s3_credentials)
+    # Pool workers leave through os._exit, which skips atexit handlers; multiprocessing
+    # finalizers with an exit priority do run when a worker shuts down normally
+    util.Finalize(None, _SINK.flush, exitpriority=10)
 
 class LocalStorageS3Upload:
     def __init__(self, base_dir='', sub_folder='', save_to_local=False, num_processes=None):
@@ -34,17 +187,22 @@ class LocalStorageS3Upload:
             if self.sub_folder:
                 self._setup_directories(self.sub_folder)
 
-        self.manager = Manager()
-        self.cumulative_counts = self.manager.dict()
-        self.cumulative_counts['words'] = 0
-        self.cumulative_counts['chars'] = 0
+        # Workers return their per-file counts, so the totals only live in the parent process
+        self.cumulative_token_count_words = 0
+        self.cumulative_token_count_chars = 0
 
-        self.global_summary_path = f"{self.destination_bucket}/global_summary.parquet"
+        # Each run writes its own run_<timestamp>.parquet here (the layout tokenizer_client uses);
+        # the latest one holds the current totals
+        self.global_summary_dir = f"{self.destination_bucket}/global_summary"
+        # Single-file summary written before the per-run layout; read only while no run file exists
+        self.legacy_global_summary_path = f"{self.destination_bucket}/global_summary.parquet"
         self.log_file = "token_count.log"
-        logging.basicConfig(filename=self.log_file, level=logging.INFO,
+        logging.basicConfig(filename=self.log_file, level=LOG_LEVEL,
                           format='%(asctime)s - %(message)s')
         
         self.count = 0
+        # Directory -> files under it, so each tree is walked only once
+        self._files_cache = {}
         self.load_global_summary()
 
     def _get_s3_client(self):
@@ -68,43 +226,74 @@ class LocalStorageS3Upload:
     def __repr__(self):
         return self.__str__()
 
+    def _walk(self, root):
+        """Yield the regular files below root; DirEntry caches the file type, so no stat per entry"""
+        with os.scandir(root) as it:
+            for entry in it:
+                # Broken symlinks, FIFOs and sockets are skipped: they cannot be read as documents
+                if entry.is_file():
+                    yield Path(entry.path)
+                elif entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path)
+
+    def _list_files(self, directory):
+        """Return the files below directory, walking it on first use only"""
+        directory = Path(directory)
+        if directory not in self._files_cache:
+            self._files_cache[directory] = list(self._walk(directory))
+        return self._files_cache[directory]
+
     @property
     def total_files(self):
         """Count total number of files in raw_data directory"""
         self.count = 0
         try:
-            for file in self.raw_data_dir.glob('**/*'):
-                if file.is_file():
-                    self.count += 1
+            self.count = len(self._list_files(self.raw_data_dir))
         except Exception as e:
             logging.error(f"Error counting files: {str(e)}")
         return self.count
 
     def load_global_summary(self):
-        """Load existing global summary if available"""
+        """Load existing global summary if available, falling back to the legacy single-file summary"""
         try:
-            if self.save_to_local and Path(self.global_summary_path).exists():
-                df = pd.read_parquet(self.global_summary_path)
+            if self.save_to_local:
+                # Run files are named by timestamp, so the last one in sort order is the latest
+                run_files = sorted(Path(self.global_summary_dir).glob('run_*.parquet'))
+                if run_files:
+                    source = run_files[-1]
+                elif Path(self.legacy_global_summary_path).exists():
+                    source = self.legacy_global_summary_path
+                else:
+                    return
+                df = pd.read_parquet(source)
                 if not df.empty:
                     last_row = df.iloc[-1]
-                    self.cumulative_counts['words'] = last_row.get('word_token_count', 0)
-                    self.cumulative_counts['chars'] = last_row.get('char_token_count', 0)
-                    logging.info(f"Loaded existing global summary: {self.cumulative_counts['words']} words, {self.cumulative_counts['chars']} chars")
-            elif not self.save_to_local:
+                    self.cumulative_token_count_words = last_row.get('word_token_count', 0)
+                    self.cumulative_token_count_chars = last_row.get('char_token_count', 0)
+                    logging.info(f"Loaded existing global summary from {source}: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
+            else:
                 client = self._get_s3_client()
+                paginator = client.get_paginator('list_objects_v2')
+                run_keys = [
+                    obj['Key']
+                    for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.global_summary_dir}/run_")
+                    for obj in page.get('Contents', [])
+                ]
+                key = max(run_keys) if run_keys else self.legacy_global_summary_path
                 try:
                     response = client.get_object(
                         Bucket=self.bucket_name,
-                        Key=self.global_summary_path
+                        Key=key
                     )
-                    df = pd.read_parquet(io.BytesIO(response['Body'].read()))
-                    if not df.empty:
-                        last_row = df.iloc[-1]
-                        self.cumulative_counts['words'] = last_row.get('word_token_count', 0)
-                        self.cumulative_counts['chars'] = last_row.get('char_token_count', 0)
-                        logging.info(f"Loaded existing global summary from S3: {self.cumulative_counts['words']} words, {self.cumulative_counts['chars']} chars")
                 except client.exceptions.NoSuchKey:
                     logging.info("No existing global summary found in S3")
+                    return
+                df = pd.read_parquet(io.BytesIO(response['Body'].read()))
+                if not df.empty:
+                    last_row = df.iloc[-1]
+                    self.cumulative_token_count_words = last_row.get('word_token_count', 0)
+                    self.cumulative_token_count_chars = last_row.get('char_token_count', 0)
+                    logging.info(f"Loaded existing global summary from S3 {key}: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
         except Exception as e:
             logging.error(f"Error loading global summary: {str(e)}")
             print(f"Error loading global summary: {str(e)}")
@@ -148,299 +337,248 @@ class LocalStorageS3Upload:
     def _process_directory(self, directory_path, subdir_name):
         """Process all files in a directory using multiprocessing"""
         try:
-            self.current_sub_folder = subdir_name
-            file_list = list(directory_path.glob('**/*'))
-            files = [f for f in file_list if f.is_file()]
-            
-            with Pool(processes=self.num_processes) as pool:
-                process_func = partial(self.process_object_wrapper, 
-                                     subdir_name=subdir_name,
-                                     save_to_local=self.save_to_local,
-                                     bucket_name=self.bucket_name,
-                                     destination_bucket=self.destination_bucket)
-                results = list(tqdm(pool.imap(process_func, files), 
+            files = self._list_files(directory_path)
+            
+            # A PDF's pages are extracted in a single worker (PDFium is not thread-safe and pool workers
+            # cannot start processes of their own), so large PDFs are started first, largest first, one per
+            # task: they run alongside each other instead of being left as stragglers at the end of a chunk
+            pdf_sizes = {f: f.stat().st_size for f in files if f.suffix.lower() == '.pdf'}
+            large_pdfs = sorted((f for f, size in pdf_sizes.items() if size >= LARGE_PDF_BYTES),
+                                key=pdf_sizes.get, reverse=True)
+            large_pdf_set = set(large_pdfs)
+            other_files = [f for f in files if f not in large_pdf_set]
+            
+            # Hand the remaining files out in chunks (about four per worker) to cut per-task IPC;
+            # counts are summed, so results can arrive in any order
+            chunksize = max(1, len(other_files) // (self.num_processes * 4))
+            
+            # The credentials are read once here and handed to every worker
+            s3_credentials = (os.getenv("AWS_REGION"), os.getenv("AWS_ACCESS_KEY"), os.getenv("AWS_SECRET_KEY"))
+            
+            with Pool(processes=self.num_processes, maxtasksperchild=MAX_TASKS_PER_CHILD, initializer=_init_worker,
+                      initargs=(subdir_name, self.save_to_local, self.bucket_name, self.destination_bucket,
+                                s3_credentials)) as pool:
+                # Both calls queue their tasks immediately, so the large PDFs are ahead in the task queue
+                results = list(tqdm(chain(pool.imap_unordered(self.process_object_wrapper, large_pdfs, chunksize=1),
+                                          pool.imap_unordered(self.process_object_wrapper, other_files, chunksize=chunksize)), 
                                   total=len(files), 
                                   desc=f"Processing files in {subdir_name}"))
+                # Let the workers exit normally so that each one writes out its last batch
+                pool.close()
+                pool.join()
             
-            for word_count, char_count in results:
-                if word_count is not None and char_count is not None:
-                    with self.manager.Lock():
-                        self.cumulative_counts['words'] += word_count
-                        self.cumulative_counts['chars'] += char_count
+            # Reduce the per-file counts in a single pass; no state is shared with the workers
+            word_count, char_count = map(sum, zip(*results)) if results else (0, 0)
+            self.cumulative_token_count_words += word_count
+            self.cumulative_token_count_chars += char_count
             
         except Exception as e:
             print(f"Error processing directory {directory_path}: {str(e)}")
             logging.error(f"Error processing directory {directory_path}: {str(e)}")
 
     @staticmethod
-    def process_object_wrapper(file_path, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_object_wrapper(file_path):
         """Wrapper function for multiprocessing"""
         rel_path = file_path.relative_to(file_path.parent.parent)
-        logging.info(f"Found raw data object: {rel_path}")
-        return LocalStorageS3Upload.process_object_static(
-            file_path, subdir_name, save_to_local, bucket_name, destination_bucket)
+        logging.info("Found raw data object: %s", rel_path)
+        return LocalStorageS3Upload.process_object_static(file_path)
 
     @staticmethod
-    def process_object_static(file_path, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_object_static(file_path):
         """Static method to process a single file"""
         try:
             file_extension = file_path.suffix.lower().lstrip('.')
             key = str(file_path.relative_to(file_path.parent.parent))
             
             if file_extension == "pdf":
-                return LocalStorageS3Upload.process_pdf_static(
-                    file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket)
+                return LocalStorageS3Upload.process_pdf_static(file_path, key)
             elif file_extension == "html":
-                return LocalStorageS3Upload.process_html_static(
-                    file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket)
+                return LocalStorageS3Upload.process_html_static(file_path, key)
             elif file_extension == "txt":
-                return LocalStorageS3Upload.process_txt_static(
-                    file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket)
+                return LocalStorageS3Upload.process_txt_static(file_path, key)
             elif file_extension == "json":
-                return LocalStorageS3Upload.process_json_static(
-                    file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket)
+                return LocalStorageS3Upload.process_json_static(file_path, key)
             else:
-                logging.info(f"Unsupported file type: {file_extension}")
+                logging.info("Unsupported file type: %s", file_extension)
                 return 0, 0
                 
         except Exception as e:
             print(f"Error processing object {file_path}: {str(e)}")
-            logging.error(f"Error processing object {file_path}: {str(e)}")
+            logging.error("Error processing object %s: %s", file_path, e)
             return 0, 0
 
     @staticmethod
-    def process_pdf_static(file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_pdf_static(file_path, key):
         """Static method to process PDF file"""
         try:
-            with open(file_path, 'rb') as file:
-                reader = PdfReader(file)
-                text = "".join(page.extract_text() or "" for page in reader.pages)
-            
-            words, word_token_count = LocalStorageS3Upload.count_words(text)
-            chars, char_token_count = LocalStorageS3Upload.count_characters(text)
+            # PDFium parses and extracts text in native code
+            pdf = pdfium.PdfDocument(str(file_path))
+            try:
+                page_texts = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    page_texts.append(textpage.get_text_range())
+                    # Release page handles right away instead of waiting for the document
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
+            # Pages do not end with a newline; without one, words at page boundaries would merge.
+            # Empty pages are skipped, as tokenizer_client does, so blank pages add no characters
+            text = "".join(page_text + "\n" for page_text in page_texts if page_text)
+            
+            words, word_token_count, chars, char_token_count = LocalStorageS3Upload.count_words_and_chars(text)
 
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
-            print(f"PDF Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
+            logging.info("%s : Word Tokens = %d, Character Tokens = %d", key, word_token_count, char_token_count)
+            if VERBOSE:
+                print(f"PDF Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
             
-            LocalStorageS3Upload.save_file_summary_static(
-                key, 'pdf', word_token_count, char_token_count, subdir_name, 
-                save_to_local, bucket_name, destination_bucket)
-            LocalStorageS3Upload.save_file_tokens_static(
-                key, words, chars, subdir_name, save_to_local, bucket_name, destination_bucket)
+            LocalStorageS3Upload.save_file_summary_static(key, 'pdf', word_token_count, char_token_count)
+            LocalStorageS3Upload.save_file_tokens_static(key, words, chars)
             
             return word_token_count, char_token_count
             
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
-            logging.error(f"Error processing PDF: {str(e)}")
+            logging.error("Error processing PDF: %s", e)
             return 0, 0
 
     @staticmethod
-    def process_html_static(file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_html_static(file_path, key):
         """Static method to process HTML file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
-                soup = BeautifulSoup(file, 'html.parser')
-                text = soup.get_text().strip()
-                text = os.linesep.join([s for s in text.splitlines() if s.strip()])
-            
-            words, word_token_count = LocalStorageS3Upload.count_words(text)
-            chars, char_token_count = LocalStorageS3Upload.count_characters(text)
+                html = file.read()
+            
+            # Lexbor parses in C, unlike BeautifulSoup's pure-Python html.parser
+            tree = LexborHTMLParser(html)
+            # BeautifulSoup's get_text left out script and style contents; so does this
+            for node in tree.css('script, style'):
+                node.decompose()
+            # Text nodes are joined as get_text() joined them, so inline markup does not split words
+            text = tree.root.text(separator='').strip()
+            text = os.linesep.join([s for s in text.splitlines() if s.strip()])
+            
+            words, word_token_count, chars, char_token_count = LocalStorageS3Upload.count_words_and_chars(text)
 
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
-            print(f"HTML Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
+            logging.info("%s : Word Tokens = %d, Character Tokens = %d", key, word_token_count, char_token_count)
+            if VERBOSE:
+                print(f"HTML Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
             
-            LocalStorageS3Upload.save_file_summary_static(
-                key, 'html', word_token_count, char_token_count, subdir_name, 
-                save_to_local, bucket_name, destination_bucket)
-            LocalStorageS3Upload.save_file_tokens_static(
-                key, words, chars, subdir_name, save_to_local, bucket_name, destination_bucket)
+            LocalStorageS3Upload.save_file_summary_static(key, 'html', word_token_count, char_token_count)
+            LocalStorageS3Upload.save_file_tokens_static(key, words, chars)
             
             return word_token_count, char_token_count
             
         except Exception as e:
             print(f"Error processing HTML: {str(e)}")
-            logging.error(f"Error processing HTML: {str(e)}")
+            logging.error("Error processing HTML: %s", e)
             return 0, 0
     
     @staticmethod
-    def process_txt_static(file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_txt_static(file_path, key):
         """Static method to process TXT file"""
         try:
-            # Try different encodings in order
-            encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            text = None
+            # Map the file once and decode straight from the mapping; latin-1 maps every byte,
+            # so it always succeeds when UTF-8 does not (cp1252 and iso-8859-1 were never reached)
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    text, encoding = "", 'utf-8'
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        try:
+                            text, encoding = str(mm, 'utf-8'), 'utf-8'
+                        except UnicodeDecodeError:
+                            text, encoding = str(mm, 'latin-1'), 'latin-1'
+            # Reading the bytes skips the newline translation that text mode did
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            logging.info("Successfully read %s with %s encoding", key, encoding)
             
-            for encoding in encodings_to_try:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        text = file.read()
-                    # If we successfully read the file, break the loop
-                    logging.info(f"Successfully read {key} with {encoding} encoding")
-                    break
-                except UnicodeDecodeError:
-                    # If this encoding doesn't work, try the next one
-                    continue
-            
-            # If none of the encodings worked
-            if text is None:
-                logging.error(f"Could not decode {key} with any of the attempted encodings")
-                print(f"Error: Could not decode {key} with any of the attempted encodings")
-                return 0, 0
-                
-            words, word_token_count = LocalStorageS3Upload.count_words(text)
-            chars, char_token_count = LocalStorageS3Upload.count_characters(text)
+            words, word_token_count, chars, char_token_count = LocalStorageS3Upload.count_words_and_chars(text)
             
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
-            print(f"TXT Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
+            logging.info("%s : Word Tokens = %d, Character Tokens = %d", key, word_token_count, char_token_count)
+            if VERBOSE:
+                print(f"TXT Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
             
-            LocalStorageS3Upload.save_file_summary_static(
-                key, 'txt', word_token_count, char_token_count, subdir_name, 
-                save_to_local, bucket_name, destination_bucket)
-            LocalStorageS3Upload.save_file_tokens_static(
-                key, words, chars, subdir_name, save_to_local, bucket_name, destination_bucket)
+            LocalStorageS3Upload.save_file_summary_static(key, 'txt', word_token_count, char_token_count)
+            LocalStorageS3Upload.save_file_tokens_static(key, words, chars)
             
             return word_token_count, char_token_count
             
         except Exception as e:
             print(f"Error processing TXT: {str(e)}")
-            logging.error(f"Error processing TXT: {str(e)}")
+            logging.error("Error processing TXT: %s", e)
             return 0, 0
 
     @staticmethod
-    def process_json_static(file_path, key, subdir_name, save_to_local, bucket_name, destination_bucket):
+    def process_json_static(file_path, key):
         """Static method to process JSON file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            with open(file_path, 'rb') as file:
                 raw_content = file.read()
-                
+            
+            # The document is counted as written; re-dumping it would only change its whitespace.
+            # It is still parsed (by orjson, in native code) so that malformed files are reported
             try:
-                json_data = json.loads(raw_content)
-                text = json.dumps(json_data)
-            except json.JSONDecodeError as json_err:
-                # If JSON parsing fails, use the raw content and log the error
-                text = raw_content
-                logging.warning(f"JSON parsing error in {key}: {str(json_err)}. Using raw content for counting.")
+                orjson.loads(raw_content)
+            except orjson.JSONDecodeError as json_err:
+                logging.warning("JSON parsing error in %s: %s. Using raw content for counting.", key, json_err)
                 print(f"Warning: JSON parsing error in {key}: {str(json_err)}. Using raw content for counting.")
+            # Reading the bytes skips the newline translation that text mode did
+            text = raw_content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
                 
-            words, word_token_count = LocalStorageS3Upload.count_words(text)
-            chars, char_token_count = LocalStorageS3Upload.count_characters(text)
+            words, word_token_count, chars, char_token_count = LocalStorageS3Upload.count_words_and_chars(text)
             
-            logging.info(f"{key} : Word Tokens = {word_token_count}, Character Tokens = {char_token_count}")
-            print(f"JSON Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
+            logging.info("%s : Word Tokens = %d, Character Tokens = %d", key, word_token_count, char_token_count)
+            if VERBOSE:
+                print(f"JSON Name: {key}\nWord Tokens: {word_token_count}\nCharacter Tokens: {char_token_count}")
             
-            LocalStorageS3Upload.save_file_summary_static(
-                key, 'json', word_token_count, char_token_count, subdir_name, 
-                save_to_local, bucket_name, destination_bucket)
-            LocalStorageS3Upload.save_file_tokens_static(
-                key, words, chars, subdir_name, save_to_local, bucket_name, destination_bucket)
+            LocalStorageS3Upload.save_file_summary_static(key, 'json', word_token_count, char_token_count)
+            LocalStorageS3Upload.save_file_tokens_static(key, words, chars)
             
             return word_token_count, char_token_count
             
         except Exception as e:
             print(f"Error processing JSON: {str(e)}")
-            logging.error(f"Error processing JSON: {str(e)}")
+            logging.error("Error processing JSON: %s", e)
             return 0, 0
 
     @staticmethod
-    def save_file_summary_static(key, file_type, word_token_count, char_token_count, subdir_name, 
-                               save_to_local, bucket_name, destination_bucket):
-        """Static method to save file summary"""
+    def save_file_summary_static(key, file_type, word_token_count, char_token_count):
+        """Static method to buffer the file summary in this worker's batch"""
         try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = LocalStorageS3Upload.get_safe_filename_static(key)
-            file_summary_df = pd.DataFrame([{
+            timestamp = _timestamp()
+            _SINK.add(summary_row={
                 'filename': key,
                 'file_type': file_type,
                 'word_token_count': word_token_count,
                 'char_token_count': char_token_count,
                 'process_timestamp': timestamp
-            }])
-            
-            file_summary_buffer = io.BytesIO()
-            file_summary_df.to_parquet(file_summary_buffer)
-            file_summary_buffer.seek(0)
-            
-            file_summary_key = f"{destination_bucket}/{subdir_name}/summaries/{base_filename}.parquet"
-
-            if save_to_local:
-                file_summary_df.to_parquet(f'{file_summary_key}')
-            else:
-                client = boto3.client(
-                    "s3",
-                    region_name=os.getenv("AWS_REGION"),
-                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
-                    aws_secret_access_key=os.getenv("AWS_SECRET_KEY")
-                )
-                client.put_object(
-                    Bucket=bucket_name,
-                    Key=file_summary_key,
-                    Body=file_summary_buffer.getvalue()
-                )
-            logging.info(f"Uploaded file summary to {file_summary_key}")
+            })
             
         except Exception as e:
-            logging.error(f"Error saving file summary for {key}: {str(e)}")
+            logging.error("Error saving file summary for %s: %s", key, e)
             print(f"Error saving file summary for {key}: {str(e)}")
 
     @staticmethod
-    def save_file_tokens_static(key, words, chars, subdir_name, save_to_local, bucket_name, destination_bucket):
-        """Static method to save file tokens"""
+    def save_file_tokens_static(key, words, chars):
+        """Static method to buffer the file tokens in this worker's batch"""
         try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = LocalStorageS3Upload.get_safe_filename_static(key)
-            
-            word_tokens_list = [{'index': idx, 'token': token} for idx, token in enumerate(words)]
-            if word_tokens_list:
-                word_tokens_df = pd.DataFrame(word_tokens_list)
-                word_tokens_buffer = io.BytesIO()
-                word_tokens_df.to_parquet(word_tokens_buffer)
-                word_tokens_buffer.seek(0)
-                
-                word_tokens_key = f"{destination_bucket}/{subdir_name}/tokens/{base_filename}_words.parquet"
-
-                if save_to_local:
-                    word_tokens_df.to_parquet(f'{word_tokens_key}')
-                else:
-                    client = boto3.client(
-                        "s3",
-                        region_name=os.getenv("AWS_REGION"),
-                        aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
-                        aws_secret_access_key=os.getenv("AWS_SECRET_KEY")
-                    )
-                    client.put_object(
-                        Bucket=bucket_name,
-                        Key=word_tokens_key,
-                        Body=word_tokens_buffer.getvalue()
-                    )
-                logging.info(f"Uploaded word tokens for {base_filename}")
-            
-            char_tokens_list = [{'index': idx, 'token': token} for idx, token in enumerate(chars)]
-            char_tokens_df = pd.DataFrame(char_tokens_list)
-            char_tokens_buffer = io.BytesIO()
-            char_tokens_df.to_parquet(char_tokens_buffer)
-            char_tokens_buffer.seek(0)
-            
-            char_tokens_key = f"{destination_bucket}/{subdir_name}/tokens/{base_filename}_chars.parquet"
-
-            if save_to_local:
-                char_tokens_df.to_parquet(f'{char_tokens_key}')
-            else:
-                client = boto3.client(
-                    "s3",
-                    region_name=os.getenv("AWS_REGION"),
-                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
-                    aws_secret_access_key=os.getenv("AWS_SECRET_KEY")
-                )
-                client.put_object(
-                    Bucket=bucket_name,
-                    Key=char_tokens_key,
-                    Body=char_tokens_buffer.getvalue()
-                )
-            logging.info(f"Uploaded char tokens for {base_filename}")
+            # Tokens of all files in a batch share one object, so each row names its file; the name is
+            # dictionary-encoded, so it is held once per file rather than once per token
+            _SINK.add(
+                word_table=pa.table({
+                    'filename': _filename_column(key, len(words)),
+                    'token': pa.array(words, type=pa.string())
+                }),
+                char_table=pa.table({
+                    'filename': _filename_column(key, len(chars)),
+                    'token': pa.array(chars, type=pa.string())
+                })
+            )
             
         except Exception as e:
-            logging.error(f"Error saving tokens for {key}: {str(e)}")
+            logging.error("Error saving tokens for %s: %s", key, e)
             print(f"Error saving tokens for {key}: {str(e)}")
 
     def update_global_summary(self):
@@ -448,60 +586,60 @@ class LocalStorageS3Upload:
         try:
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             new_summary = {
-                'word_token_count': self.cumulative_counts['words'],
-                'char_token_count': self.cumulative_counts['chars'],
+                'word_token_count': int(self.cumulative_token_count_words),
+                'char_token_count': int(self.cumulative_token_count_chars),
                 'process_timestamp': timestamp
             }
             
-            if self.save_to_local and Path(self.global_summary_path).exists():
-                try:
-                    existing_df = pd.read_parquet(self.global_summary_path)
-                    updated_df = pd.concat([existing_df, pd.DataFrame([new_summary])], ignore_index=True)
-                except:
-                    updated_df = pd.DataFrame([new_summary])
-            else:
-                updated_df = pd.DataFrame([new_summary])
-                
+            # Write this run's record as its own file instead of downloading and rewriting the whole history
+            summary_table = pa.Table.from_pylist([new_summary])
+            global_summary_key = f"{self.global_summary_dir}/run_{timestamp}.parquet"
+            
             if self.save_to_local:
-                updated_df.to_parquet(self.global_summary_path)
+                os.makedirs(self.global_summary_dir, exist_ok=True)
+                pq.write_table(summary_table, global_summary_key, use_dictionary=False, **PARQUET_OPTIONS)
             else:
                 client = self._get_s3_client()
-                summary_buffer = io.BytesIO()
-                updated_df.to_parquet(summary_buffer)
-                summary_buffer.seek(0)
-                client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=self.global_summary_path,
-                    Body=summary_buffer.getvalue()
-                )
-            
-            print(f"Successfully updated global summary: {self.cumulative_counts['words']} words, {self.cumulative_counts['chars']} chars")
-            logging.info(f"Successfully updated global summary: {self.cumulative_counts['words']} words, {self.cumulative_counts['chars']} chars")
+                summary_buffer = pa.BufferOutputStream()
+                pq.write_table(summary_table, summary_buffer, use_dictionary=False, **PARQUET_OPTIONS)
+                client.upload_fileobj(pa.BufferReader(summary_buffer.getvalue()), self.bucket_name, global_summary_key, Config=TRANSFER_CONFIG)
+            
+            print(f"Successfully updated global summary: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
+            logging.info(f"Successfully updated global summary: {self.cumulative_token_count_words} words, {self.cumulative_token_count_chars} chars")
             
         except Exception as e:
             logging.error(f"Error updating global summary: {str(e)}")
             print(f"Error updating global summary: {str(e)}")
 
     @staticmethod
-    def get_safe_filename_static(key):
-        """Extract a safe filename from the key"""
-        base_name = os.path.basename(key)
-        base_name = os.path.splitext(base_name)[0]
-        import re
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', base_name)
-        return safe_name
-
-    @staticmethod
-    def count_words(text: str):
-        """Counts tokens by splitting text by space"""
-        tokens = text.split()
-        return tokens, len(tokens)
-
-    @staticmethod
-    def count_characters(text: str):
-        """Counts characters excluding spaces"""
-        text_without_spaces = text.replace(" ", "")
-        return list(text_without_spaces), len(text_without_spaces)
+    def count_words_and_chars(text: str):
+        """
+        Tokenizes the text into words (split on whitespace) and characters (excluding spaces) from the
+        UTF-8 encoding of it (words use a second one when the text is not pure ASCII). Returns
+        (words, word_count, chars, char_count), with the tokens as Arrow string arrays built from
+        the text's bytes, so no Python object is created per token.
+        """
+        buf = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        
+        # Words are runs of bytes that are not whitespace. Non-ASCII whitespace is mapped to a space
+        # first, on a separate encoding so that the characters below keep the original text
+        word_buf = buf
+        if not text.isascii():
+            word_buf = np.frombuffer(_UNICODE_WHITESPACE_RE.sub(' ', text).encode('utf-8'), dtype=np.uint8)
+        is_word = ~_WHITESPACE_BYTES[word_buf]
+        edges = np.diff(is_word.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        word_starts = np.flatnonzero(edges == 1)
+        word_ends = np.flatnonzero(edges == -1)
+        word_offsets = np.zeros(word_starts.size + 1, dtype=np.int32)
+        np.cumsum(word_ends - word_starts, out=word_offsets[1:])
+        words = pa.StringArray.from_buffers(word_starts.size, pa.py_buffer(word_offsets), pa.py_buffer(word_buf[is_word]))
+        
+        # Characters: with spaces removed, every byte that is not a UTF-8 continuation byte starts one
+        char_bytes = buf[buf != 0x20]
+        char_offsets = np.append(np.flatnonzero((char_bytes & 0xC0) != 0x80), char_bytes.size).astype(np.int32)
+        chars = pa.StringArray.from_buffers(char_offsets.size - 1, pa.py_buffer(char_offsets), pa.py_buffer(char_bytes))
+        
+        return words, len(words), chars, len(chars)
 
 if __name__ == '__main__':
     client = LocalStorageS3Upload(
@@ -1,13 +1,37 @@
-import subprocess
+import os
+import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm.auto import tqdm
 
-with open('rerun_files.txt', 'r') as f:
-    files = f.readlines()
+BUCKET = "llm4eo-s3"
+PREFIX = "raw_data_unduplicated"
+MAX_WORKERS = 32
+
+# A single client is thread-safe and reuses its connection pool across downloads; the pool
+# (10 connections by default) is sized so that every download thread keeps its connection
+s3 = boto3.client(
+    "s3",
+    region_name=os.getenv("AWS_REGION"),
+    aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+    aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+    config=Config(max_pool_connections=MAX_WORKERS)
+)
 
-for _file in files:
-    provider, file = _file.split('/')
-    bucket = f"s3://llm4eo-s3/raw_data_unduplicated/{provider}"
+def download(provider, file):
+    key = f"{PREFIX}/{provider}/{file}"
     destination = f"data/{provider}"
-    s3_path = f"{bucket}/{file}"
     local_path = f"{destination}/{file}"
-    
-    subprocess.run(["aws", "s3", "cp", s3_path, local_path], check=True)
\ No newline at end of file
+
+    os.makedirs(destination, exist_ok=True)
+    s3.download_file(BUCKET, key, local_path)
+    return local_path
+
+with open('rerun_files.txt', 'r') as f:
+    files = [line.strip() for line in f if line.strip()]
+
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    futures = {executor.submit(download, *_file.split('/')): _file for _file in files}
+
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading files"):
+        future.result()